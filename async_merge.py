@@ -0,0 +1,96 @@
+"""
+Asyncio front-end for the PDF merger.
+
+merge_async() lets an event loop drive many dossier builds at once. Input
+checks run as non-blocking stat calls on the loop; the CPU-heavy insert_pdf
+and save work runs in a shared process pool (PyMuPDF is not thread-safe),
+with a semaphore bounding how many merges are in flight. Cancelling the
+awaiting task stops the merge between two input files.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from script import INPUT_DIR, OUTPUT_PDF, is_in_memory, iter_leaves, leaf_file, merge_pdfs
+
+# 🔹 Maximum number of merges running at the same time
+MAX_CONCURRENT_MERGES = os.cpu_count() or 1
+
+_executor = None
+_manager = None
+_semaphores = weakref.WeakKeyDictionary()  # One semaphore per event loop
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_CONCURRENT_MERGES)
+    return _executor
+
+
+def _new_cancel_event():
+    # Worker processes cannot share a plain threading.Event: go through a
+    # manager so the loop can flag a running merge as cancelled
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.Manager()
+    return _manager.Event()
+
+
+def _get_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_MERGES)
+    return semaphore
+
+
+async def _missing_inputs(schema, input_dir):
+    paths = [
+        os.path.join(input_dir, leaf_file(leaf))
+        for leaf in iter_leaves(schema) if not is_in_memory(leaf)
+    ]
+    found = await asyncio.gather(*(asyncio.to_thread(os.path.exists, path) for path in paths))
+    return [path for path, exists in zip(paths, found) if not exists]
+
+
+async def merge_async(schema, input_dir=INPUT_DIR, output_pdf=OUTPUT_PDF, *,
+                      executor=None, semaphore=None, **options):
+    """Merge one dossier without blocking the event loop.
+
+    Extra keyword arguments are passed on to merge_pdfs. Returns the same
+    stats dict as merge_pdfs.
+    """
+    for path in await _missing_inputs(schema, input_dir):
+        print(f"⚠️ File not found: {path}")
+
+    cancel_event = _new_cancel_event()
+    job = partial(merge_pdfs, schema, input_dir, output_pdf, cancel_event=cancel_event, **options)
+
+    async with semaphore or _get_semaphore():
+        pool_future = (executor or _get_executor()).submit(job)
+        future = asyncio.wrap_future(pool_future)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Queued jobs are dropped by the executor; a running one stops at
+            # its next input file. Wait for it so the slot is really free.
+            cancel_event.set()
+            pool_future.cancel()
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+
+async def shutdown():
+    # Stop the shared process pool, e.g. from the web app's shutdown hook
+    global _executor, _manager
+    if _executor is not None:
+        await asyncio.to_thread(_executor.shutdown)
+        _executor = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
@@ -0,0 +1,303 @@
+"""
+Benchmark suite for the PDF merger.
+
+Generates synthetic dossiers locally (text PDFs, image-heavy scans, PDFs with
+many annotations and links, deep nested schemas) and runs merge_pdfs over a
+matrix of sizes and save profiles. Throughput (pages/s, MB/s) and peak memory
+of every run are appended as JSON lines to a results file, so runs from
+different versions can be compared.
+
+The --memory case merges many distinct large scans with and without
+streaming, to check that streaming keeps peak memory close to the size of the
+largest input rather than of the whole dossier.
+
+Usage:
+    python benchmark.py --sizes small medium --profiles fast smallest --label my-branch
+    python benchmark.py --memory
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from instrumentation import peak_rss_bytes
+
+# 🔹 Benchmark matrix
+SIZES = {
+    # people: top-level sections, pages: pages per generated input
+    "small": {"people": 2, "pages": 2, "depth": 2},
+    "medium": {"people": 10, "pages": 5, "depth": 3},
+    "large": {"people": 50, "pages": 10, "depth": 3},
+}
+KINDS = ["text", "scan", "annotated"]
+MEMORY_FILES = 12  # Distinct scans in the memory case
+MEMORY_PAGES = 8  # Pages per scan, about 2 MB each
+BENCH_DIR = "bench_data"
+RESULTS_FILE = "bench_results.jsonl"
+
+
+def make_text_pdf(path, pages):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        lines = "\n".join(
+            f"Ligne {line} de la page {number + 1} - lorem ipsum dolor sit amet"
+            for line in range(45)
+        )
+        page.insert_text((50, 60), lines, fontsize=10)
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+def make_scan_pdf(path, pages, width=1240, height=1754, seed=0):
+    # Noisy grey pixmaps compress about as badly as real phone scans
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        samples = rng.randbytes(width * height)
+        pix = fitz.Pixmap(fitz.csGRAY, width, height, samples, False)
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+def make_annotated_pdf(path, pages, per_page=20):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    for number, page in enumerate(doc):
+        for index in range(per_page):
+            y = 50 + index * 35
+            page.insert_text((50, y), f"Entrée {index}", fontsize=10)
+            page.add_text_annot((400, y - 10), f"Note {number}.{index}")
+            page.insert_link({
+                "kind": fitz.LINK_GOTO,
+                "from": fitz.Rect(50, y - 10, 200, y + 4),
+                "page": (number + index) % len(doc),
+            })
+            page.insert_link({
+                "kind": fitz.LINK_URI,
+                "from": fitz.Rect(200, y - 10, 350, y + 4),
+                "uri": f"https://example.com/{number}/{index}",
+            })
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+GENERATORS = {
+    "text": make_text_pdf,
+    "scan": make_scan_pdf,
+    "annotated": make_annotated_pdf,
+}
+
+
+def generate_inputs(input_dir, pages):
+    # One file per kind is enough: the schema references them many times
+    os.makedirs(input_dir, exist_ok=True)
+    files = {}
+    for kind, generator in GENERATORS.items():
+        filename = f"{kind}-{pages}.pdf"
+        path = os.path.join(input_dir, filename)
+        if not os.path.exists(path):
+            generator(path, pages)
+        files[kind] = filename
+    return files
+
+
+def generate_scans(input_dir, count, pages):
+    # Distinct content, so nothing can be shared between the inputs
+    os.makedirs(input_dir, exist_ok=True)
+    names = []
+    for index in range(count):
+        name = f"scan-{pages}-{index}.pdf"
+        path = os.path.join(input_dir, name)
+        if not os.path.exists(path):
+            make_scan_pdf(path, pages, seed=index)
+        names.append(name)
+    return names
+
+
+def make_schema(files, people, depth, kinds=KINDS):
+    def subtree(prefix, level):
+        if level == depth:
+            return [files[kind] for kind in kinds]
+        return {
+            f"{prefix}.{index}": subtree(f"{prefix}.{index}", level + 1)
+            for index in range(3)
+        }
+
+    schema = {
+        "Introduction": {
+            "Garde": [files["text"]],
+            "Table des Matières": {"_toc_": True},
+        },
+    }
+    for person in range(people):
+        schema[f"Person {person + 1}"] = subtree(f"P{person + 1}", 1)
+    return schema
+
+
+def count_leaves(schema):
+    for content in schema.values():
+        if isinstance(content, list):
+            yield from content
+        elif isinstance(content, dict) and "_toc_" not in content:
+            yield from count_leaves(content)
+
+
+def run_case(case):
+    # Runs in a fresh process so that peak RSS belongs to this case only
+    from script import merge_pdfs
+
+    input_dir = case["input_dir"]
+    output_pdf = case["output_pdf"]
+    input_bytes = sum(
+        os.path.getsize(os.path.join(input_dir, leaf)) for leaf in count_leaves(case["schema"])
+    )
+
+    start = time.perf_counter()
+    stats = merge_pdfs(
+        case["schema"], input_dir, output_pdf,
+        profile=case["profile"], streaming=case["streaming"],
+    )
+    seconds = time.perf_counter() - start
+
+    return {
+        "size": case["size"],
+        "kinds": case["kinds"],
+        "profile": case["profile"],
+        "streaming": case["streaming"],
+        "pages": stats["pages"],
+        "seconds": seconds,
+        "merge_seconds": stats["merge_seconds"],
+        "save_seconds": stats["save_seconds"],
+        "pages_per_second": stats["pages"] / seconds if seconds else None,
+        "input_mb": input_bytes / 1e6,
+        "mb_per_second": input_bytes / 1e6 / seconds if seconds else None,
+        "output_mb": os.path.getsize(output_pdf) / 1e6,
+        "peak_rss_mb": (peak_rss_bytes() or 0) / 1e6,
+    }
+
+
+def run_benchmarks(sizes, profiles, kinds=None, streaming=(False,), bench_dir=BENCH_DIR,
+                   results_file=RESULTS_FILE, label=None):
+    kinds = kinds or [[kind] for kind in KINDS] + [KINDS]
+    environment = {
+        "label": label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "mupdf": fitz.VersionFitz,
+        "machine": platform.machine(),
+    }
+
+    results = []
+    for size in sizes:
+        params = SIZES[size]
+        input_dir = os.path.join(bench_dir, "inputs")
+        files = generate_inputs(input_dir, params["pages"])
+
+        for case_kinds in kinds:
+            schema = make_schema(files, params["people"], params["depth"], case_kinds)
+            for profile in profiles:
+                for stream in streaming:
+                    name = f"{size}-{'+'.join(case_kinds)}-{profile}{'-streaming' if stream else ''}"
+                    case = {
+                        "size": size,
+                        "kinds": case_kinds,
+                        "profile": profile,
+                        "streaming": stream,
+                        "schema": schema,
+                        "input_dir": input_dir,
+                        "output_pdf": os.path.join(bench_dir, "outputs", f"{name}.pdf"),
+                    }
+                    with ProcessPoolExecutor(max_workers=1) as pool:
+                        result = pool.submit(run_case, case).result()
+                    result.update(environment)
+                    results.append(result)
+
+                    print(f"📊 {name}: {result['pages']} pages in {result['seconds']:.2f}s "
+                          f"({result['pages_per_second']:.0f} pages/s, "
+                          f"{result['mb_per_second']:.1f} MB/s, "
+                          f"peak {result['peak_rss_mb']:.0f} MB)")
+
+                    with open(results_file, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(result) + "\n")
+
+    return results
+
+
+def run_memory_bound(bench_dir=BENCH_DIR, files=MEMORY_FILES, pages=MEMORY_PAGES,
+                     profile="balanced", results_file=RESULTS_FILE, label=None):
+    input_dir = os.path.join(bench_dir, "inputs")
+    names = generate_scans(input_dir, files, pages)
+    schema = {"Introduction": {"Table des Matières": {"_toc_": True}}}
+    for index, name in enumerate(names):
+        schema[f"Person {index + 1}"] = {"Scans": [name]}
+    largest = max(os.path.getsize(os.path.join(input_dir, name)) for name in names)
+
+    results = []
+    for stream in (False, True):
+        name = f"memory-{profile}{'-streaming' if stream else ''}"
+        case = {
+            "size": "memory",
+            "kinds": ["scan"],
+            "profile": profile,
+            "streaming": stream,
+            "schema": schema,
+            "input_dir": input_dir,
+            "output_pdf": os.path.join(bench_dir, "outputs", f"{name}.pdf"),
+        }
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_case, case).result()
+        result.update(label=label, largest_input_mb=largest / 1e6,
+                      timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        results.append(result)
+        with open(results_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+    plain, streamed = results
+    print(f"📊 {files} scans, {plain['input_mb']:.0f} MB in total, largest "
+          f"{largest / 1e6:.0f} MB: peak {plain['peak_rss_mb']:.0f} MB without streaming, "
+          f"{streamed['peak_rss_mb']:.0f} MB with streaming")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF merger on synthetic dossiers")
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=["small", "medium"])
+    parser.add_argument("--profiles", nargs="+", default=["fast", "balanced", "smallest"])
+    parser.add_argument("--kinds", nargs="+", choices=KINDS,
+                        help="only benchmark dossiers made of these input kinds")
+    parser.add_argument("--streaming", action="store_true", help="also run in streaming mode")
+    parser.add_argument("--memory", action="store_true",
+                        help="compare peak memory with and without streaming instead")
+    parser.add_argument("--bench-dir", default=BENCH_DIR)
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--label", help="tag stored with every result, e.g. a branch name")
+    args = parser.parse_args()
+
+    if args.memory:
+        run_memory_bound(args.bench_dir, results_file=args.results, label=args.label)
+        return
+
+    run_benchmarks(
+        args.sizes,
+        args.profiles,
+        kinds=[args.kinds] if args.kinds else None,
+        streaming=(False, True) if args.streaming else (False,),
+        bench_dir=args.bench_dir,
+        results_file=args.results,
+        label=args.label,
+    )
+
+
+if __name__ == "__main__":
+    main()
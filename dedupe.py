@@ -0,0 +1,123 @@
+"""
+Page-level deduplication for merged documents.
+
+Applicants often upload the same scan more than once. Every merged page is
+fingerprinted from its content streams and the content of everything its
+resources point to (images, fonts, forms), so identical pages match even when
+they came from different input files. A repeated page keeps its place in the
+page tree but is pointed at the first copy's content streams and resources.
+Its own copies become unreferenced, and the garbage collection pass of the
+save drops them.
+"""
+
+import hashlib
+import re
+
+REFERENCE = re.compile(rb"(\d+) 0 R")
+PAGE_KEYS = ("MediaBox", "CropBox", "Rotate", "UserUnit")
+
+
+class ObjectHasher:
+    """Content hashes of PDF objects that do not depend on xref numbers."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._hashes = {}  # xref -> content hash, objects are shared a lot
+
+    def object_hash(self, xref):
+        return self._hash(xref, [])[0]
+
+    def _hash(self, xref, path):
+        # Returns the hash and the xrefs of the back-references cut below it
+        digest = self._hashes.get(xref)
+        if digest is not None:
+            return digest, set()
+        if xref in path:
+            # A cycle: hash how far up the path it points, not its xref number
+            return f"cycle-{len(path) - path.index(xref)}".encode(), {xref}
+
+        source = self.doc.xref_object(xref, compressed=True).encode()
+        if b"/Type/Page" in source:
+            # A back-reference into the page tree: don't hash the whole document
+            digest = self._hashes[xref] = b"page"
+            return digest, set()
+
+        cuts = set()
+
+        def reference_hash(match):
+            digest, child_cuts = self._hash(int(match.group(1)), path)
+            cuts.update(child_cuts)
+            return digest.hex().encode()
+
+        path.append(xref)
+        try:
+            sha = hashlib.sha256()
+            # Hash what references point to, not their xref numbers
+            sha.update(REFERENCE.sub(reference_hash, source))
+        finally:
+            path.pop()
+        if self.doc.xref_is_stream(xref):
+            sha.update(self.doc.xref_stream_raw(xref))
+        digest = sha.digest()
+
+        # Objects on a cycle hash differently depending on where the walk
+        # came in: only keep hashes that did not cut one
+        if not cuts:
+            self._hashes[xref] = digest
+        cuts.discard(xref)
+        return digest, cuts
+
+    def value_hash(self, value):
+        return REFERENCE.sub(
+            lambda m: self.object_hash(int(m.group(1))).hex().encode(), value.encode()
+        )
+
+
+class PageDeduplicator:
+    def __init__(self, doc):
+        self.doc = doc
+        self.pages = 0
+        self.duplicates = 0
+        self._seen = {}  # fingerprint -> page xref of the first copy
+        self._hasher = ObjectHasher(doc)
+
+    def fingerprint(self, page_xref):
+        doc = self.doc
+        # Annotations point back at their page: leave those pages alone
+        if doc.xref_get_key(page_xref, "Annots")[0] != "null":
+            return None
+
+        sha = hashlib.sha256()
+        for key in ("Contents", "Resources") + PAGE_KEYS:
+            kind, value = doc.xref_get_key(page_xref, key)
+            sha.update(key.encode() + kind.encode() + self._hasher.value_hash(value))
+        return sha.digest()
+
+    def add_page(self, pno):
+        doc = self.doc
+        page_xref = doc.page_xref(pno)
+        self.pages += 1
+        fingerprint = self.fingerprint(page_xref)
+        if fingerprint is None:
+            return
+
+        first = self._seen.get(fingerprint)
+        if first is None:
+            self._seen[fingerprint] = page_xref
+            return
+
+        for key in ("Contents", "Resources"):
+            kind, value = doc.xref_get_key(first, key)
+            if kind != "null":
+                doc.xref_set_key(page_xref, key, value)
+        self.duplicates += 1
+
+    def stats(self):
+        return {"pages": self.pages, "duplicates": self.duplicates}
+
+
+def dedupe_pages(doc, pages):
+    deduplicator = PageDeduplicator(doc)
+    for pno in pages:
+        deduplicator.add_page(pno)
+    return deduplicator.stats()
@@ -0,0 +1,147 @@
+"""
+Content-addressed on-disk cache of merged section fragments.
+
+A fragment is the merged sub-PDF of one section. It is keyed by the content
+hashes of its inputs, in order, so the same group of files reused across
+dossiers or versions is merged once and then inserted with a single
+insert_pdf. The cache directory is bounded in bytes, and the least recently
+used fragments are evicted first.
+"""
+
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+
+FRAGMENT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+FRAGMENT_FORMAT = "1"  # Bump when the way fragments are built changes
+
+# (real path, mtime, size) -> sha256, so unchanged files are hashed once per process
+_DIGESTS = {}
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    digest = _DIGESTS.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = _DIGESTS[key] = sha.hexdigest()
+    return digest
+
+
+class FragmentCache:
+    def __init__(self, directory, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = None  # key -> size, least recently used first
+        self._bytes = 0
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pdf") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._index = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._bytes = sum(self._index.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def key(self, steps):
+        # Only sections made purely of files on disk can be addressed by content
+        sha = hashlib.sha256(FRAGMENT_FORMAT.encode())
+        for step in steps:
+            if step["kind"] != "pdf" or step["path"] is None:
+                return None
+            sha.update(file_digest(step["path"]).encode())
+            if step["selection"] is not None:
+                sha.update(repr(step["selection"]).encode())
+        return sha.hexdigest()
+
+    def get(self, key):
+        self._load_index()
+        path = self._path(key)
+        try:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            doc = fitz.open(path)
+        except Exception:
+            # Never stored, evicted by another process, or a damaged file
+            self._forget(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if key in self._index:
+            self._index.move_to_end(key)
+        try:
+            os.utime(path)  # Shared LRU order across processes
+        except OSError:
+            pass
+        return doc
+
+    def put(self, key, fragment):
+        """Store a merged fragment, close it, and return it reopened from disk."""
+        self._load_index()
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            fragment.save(tmp_path, garbage=3, deflate=True)
+            fragment.close()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._forget(key)
+        size = os.path.getsize(path)
+        self._index[key] = size
+        self._bytes += size
+
+        # Never evict the fragment we just stored
+        while len(self._index) > 1 and self._bytes > self.max_bytes:
+            oldest = next(iter(self._index))
+            self._forget(oldest)
+            self.evictions += 1
+            try:
+                os.remove(self._path(oldest))
+            except FileNotFoundError:
+                pass
+        return fitz.open(path)
+
+    def _forget(self, key):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def add_stats(self, stats):
+        """Count the hits, misses and evictions of a copy used in another process."""
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+        self.evictions += stats["evictions"]
+        self._index = None  # The other process may have stored fragments: rescan
+        self._load_index()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "fragments": len(self._index or ()),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,147 @@
+"""
+Image downsampling and recompression for scan-heavy dossiers.
+
+Runs on the merged document before it is saved. Every image is measured
+against the largest size at which it is displayed. Images above the target
+resolution are downsampled and re-encoded in a process pool: grayscale
+content is stored as gray, bilevel scans are stored losslessly at one bit
+per pixel, and everything else is stored as JPEG. Images already at or below
+the target, or that cannot be decoded, are left untouched, and a result is
+only kept if it is smaller than the original.
+"""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+IMAGE_TARGET_DPI = 150
+IMAGE_JPEG_QUALITY = 75
+IMAGE_DPI_TOLERANCE = 1.2  # Leave images up to 20% above the target alone
+GRAY_TOLERANCE = 8  # Max channel difference for a pixel to count as gray
+GRAY_SAMPLES = 20000  # Pixels checked when looking for color
+# Gray sample -> "0" (black) or "1" (white), for packing bilevel rows
+_BITS = bytes.maketrans(bytes(range(256)), b"0" * 128 + b"1" * 128)
+
+
+def find_oversized_images(doc, target_dpi):
+    # xref -> (pixel width, pixel height, lowest displayed resolution)
+    images = {}
+    for page in doc:
+        for info in page.get_images(full=True):
+            xref, _, width, height, bpc = info[:5]
+            if bpc == 1 or width == 0:
+                continue  # Already bilevel, or an image mask
+            if any(doc.xref_get_key(xref, key)[0] != "null" for key in ("Decode", "Mask")):
+                continue  # Re-encoding would lose the inversion or color-key mask
+            for rect in page.get_image_rects(xref):
+                if rect.width <= 0:
+                    continue
+                dpi = width / (rect.width / 72)
+                _, _, lowest = images.get(xref, (width, height, dpi))
+                images[xref] = (width, height, min(dpi, lowest))
+
+    return {
+        xref: (width, height, dpi)
+        for xref, (width, height, dpi) in images.items()
+        if dpi > target_dpi * IMAGE_DPI_TOLERANCE
+    }
+
+
+def is_grayscale(pix):
+    samples = pix.samples
+    step = max(len(samples) // 3 // GRAY_SAMPLES, 1) * 3
+    for i in range(0, len(samples) - 2, step):
+        r, g, b = samples[i], samples[i + 1], samples[i + 2]
+        if max(r, g, b) - min(r, g, b) > GRAY_TOLERANCE:
+            return False
+    return True
+
+
+def pack_bilevel(pix):
+    # One bit per pixel, each row padded to a whole byte, 1 is white
+    row_bytes = (pix.width + 7) // 8
+    padding = b"0" * (row_bytes * 8 - pix.width)
+    samples, stride = pix.samples, pix.stride
+    return b"".join(
+        int(samples[y * stride:y * stride + pix.width].translate(_BITS) + padding, 2)
+        .to_bytes(row_bytes, "big")
+        for y in range(pix.height)
+    )
+
+
+def recompress_image(job):
+    # Runs in a worker process: only plain bytes go in and out
+    xref, data, width, height, quality = job
+    try:
+        pix = fitz.Pixmap(data)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)  # Transparency lives in the separate /SMask
+        if pix.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        if pix.n == 3 and is_grayscale(pix):
+            pix = fitz.Pixmap(fitz.csGRAY, pix)
+        # Before scaling: smoothing the edges makes every scan look gray
+        bilevel = pix.n == 1 and pix.is_monochrome
+
+        pix = fitz.Pixmap(pix, width, height, None)
+        colorspace = "/DeviceGray" if pix.n == 1 else "/DeviceRGB"
+
+        if bilevel:
+            # JPEG artifacts would hurt black-and-white scans: keep them
+            # at one bit per pixel, flate does well on those
+            data, filter_name, bpc = zlib.compress(pack_bilevel(pix)), "/FlateDecode", 1
+        else:
+            data, filter_name, bpc = pix.tobytes("jpeg", jpg_quality=quality), "/DCTDecode", 8
+    except Exception:
+        return None  # Not something MuPDF can decode: leave it as it is
+    return data, filter_name, pix.width, pix.height, colorspace, bpc
+
+
+def optimize_images(doc, target_dpi=IMAGE_TARGET_DPI, quality=IMAGE_JPEG_QUALITY, workers=None):
+    images = find_oversized_images(doc, target_dpi)
+    stats = {"images": len(images), "replaced": 0, "skipped": 0, "bytes_saved": 0}
+    jobs = []
+    for xref, (width, height, dpi) in images.items():
+        scale = target_dpi / dpi
+        try:
+            data = doc.extract_image(xref)["image"]
+        except Exception:
+            stats["skipped"] += 1
+            continue
+        jobs.append((xref, data, max(int(width * scale), 1), max(int(height * scale), 1), quality))
+
+    if not jobs:
+        return stats
+
+    if len(jobs) == 1 or workers == 1:
+        results = map(recompress_image, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        results = pool.map(recompress_image, jobs)
+
+    try:
+        for job, result in zip(jobs, results):
+            if result is None:
+                stats["skipped"] += 1
+                continue
+            xref = job[0]
+            data, filter_name, width, height, colorspace, bpc = result
+            original = len(doc.xref_stream_raw(xref))
+            if len(data) >= original:
+                continue
+            doc.update_stream(xref, data, compress=False)
+            doc.xref_set_key(xref, "Filter", filter_name)
+            doc.xref_set_key(xref, "Width", str(width))
+            doc.xref_set_key(xref, "Height", str(height))
+            doc.xref_set_key(xref, "ColorSpace", colorspace)
+            doc.xref_set_key(xref, "BitsPerComponent", str(bpc))
+            doc.xref_set_key(xref, "DecodeParms", "null")
+            stats["replaced"] += 1
+            stats["bytes_saved"] += original - len(data)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return stats
@@ -0,0 +1,132 @@
+"""
+Incremental rebuilds of merged dossiers.
+
+A manifest stored next to the output PDF records, for every input file, its
+content hash and the page range it occupies in the output. On the next run
+only the inputs whose content changed are spliced into the existing PDF, the
+TOC is re-rendered with the new page numbers, and the file is saved
+incrementally, so small edits cost time in proportion to the change.
+"""
+
+import json
+import os
+
+from fragment_cache import file_digest
+from page_ranges import insert_pages
+
+MANIFEST_FORMAT = 2
+# Incremental saves append to the file: compact it with a full save after this many
+MAX_INCREMENTAL_SAVES = 10
+
+
+def manifest_path(output_pdf):
+    return f"{output_pdf}.manifest.json"
+
+
+def load_manifest(output_pdf):
+    try:
+        with open(manifest_path(output_pdf), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return None
+
+    # The output was rewritten by something else since: the manifest is stale
+    try:
+        stat = os.stat(output_pdf)
+    except OSError:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (manifest["output_size"], manifest["output_mtime_ns"]):
+        return None
+    return manifest
+
+
+def write_manifest(output_pdf, plan, leaves, incremental_saves=0, settings=None):
+    stat = os.stat(output_pdf)
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "output_size": stat.st_size,
+        "output_mtime_ns": stat.st_mtime_ns,
+        "page_count": plan["page_count"],
+        "toc_page": plan["toc_page"],
+        "toc_pages": len(plan["toc_layout"]),
+        "toc": plan["toc"],
+        "settings": settings,
+        "leaves": leaves,
+        "incremental_saves": incremental_saves,
+    }
+    path = manifest_path(output_pdf)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def leaf_records(plan, previous=None):
+    """One record per input file of the plan, with where its pages start.
+
+    Files whose mtime and size match the previous manifest keep their stored
+    hash instead of being read again. Returns None if the plan has inputs
+    that are not files, which cannot be tracked.
+    """
+    known = {leaf["path"]: leaf for leaf in previous["leaves"]} if previous else {}
+    records = []
+    start = 0
+    for step in plan["steps"]:
+        if step["kind"] == "pdf":
+            if step["path"] is None:
+                return None
+            stat = os.stat(step["path"])
+            old = known.get(step["path"])
+            if old and old["mtime_ns"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+                digest = old["digest"]
+            else:
+                digest = file_digest(step["path"])
+            records.append({
+                "path": step["path"],
+                "digest": digest,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "start": start,
+                "pages": step["pages"],
+                "selection": step["selection"],
+            })
+        start += step["pages"]
+    return records
+
+
+def changed_leaves(manifest, leaves, plan, settings=None):
+    """Pairs of (old record, new record) for inputs whose content changed.
+
+    Returns None when the dossier structure changed (inputs added, removed or
+    reordered, or a different number of TOC pages) or the output was produced
+    with other settings, and a full merge is needed.
+    """
+    # Compare as stored: JSON turns tuples into lists
+    if manifest.get("settings") != json.loads(json.dumps(settings)):
+        return None
+    old_leaves = manifest["leaves"]
+    if leaves is None or len(old_leaves) != len(leaves):
+        return None
+    if any(before["path"] != after["path"] for before, after in zip(old_leaves, leaves)):
+        return None
+    if manifest["toc_pages"] != len(plan["toc_layout"]):
+        return None
+
+    return [
+        (before, after)
+        for before, after in zip(old_leaves, leaves)
+        if before["digest"] != after["digest"] or before["pages"] != after["pages"]
+        or before.get("selection") != after["selection"]
+    ]
+
+
+def splice(doc, changes, open_source):
+    # Work from the end of the document so earlier page indices stay valid
+    for before, after in reversed(changes):
+        if before["pages"]:
+            doc.delete_pages(before["start"], before["start"] + before["pages"] - 1)
+        if after["pages"]:
+            insert_pages(doc, open_source(after["path"]), after["selection"],
+                         start_at=before["start"])
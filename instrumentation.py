@@ -0,0 +1,181 @@
+"""
+Lightweight timing and memory instrumentation for merge runs.
+
+Records wall time, CPU time and memory for every stage of a merge, and for
+every input file when a stage is tied to one. When the report goes to a sink,
+memory is recorded too: on Linux the kernel's RSS high-water mark is reset at
+the start of each stage, so every stage gets its own peak, reported next to
+the RSS it started and ended with. The report is a plain dict that can be
+written as JSON next to the output PDF or handed to any callable sink.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+
+# Resetting the kernel's high-water mark also lowers ru_maxrss: remember the
+# highest value seen before each reset
+_process_peak = 0
+
+
+def peak_rss_bytes():
+    # High-water mark of the whole process, not of the current stage
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    peak = peak if sys.platform == "darwin" else peak * 1024
+    return max(peak, _process_peak)
+
+
+def _proc_status(field):
+    # Value of a "kB" line of /proc/self/status, in bytes (Linux only)
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_bytes():
+    return _proc_status("VmRSS")
+
+
+def high_water_rss_bytes():
+    # Peak RSS since the last reset_high_water_rss()
+    return _proc_status("VmHWM")
+
+
+def reset_high_water_rss():
+    global _process_peak
+    peak = high_water_rss_bytes()
+    if peak is None:
+        return False
+    _process_peak = max(_process_peak, peak)
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class Instrumentation:
+    def __init__(self, sink=None, stage_memory=None):
+        # sink: None (keep in memory), True (JSON next to the output PDF),
+        # a path to a JSON file, or a callable receiving the report dict
+        # stage_memory: record memory for every stage, which reads /proc and
+        # resets the process's RSS high-water mark each time. By default only
+        # when there is a sink to report to.
+        self.sink = sink
+        self.stage_memory = bool(sink) if stage_memory is None else stage_memory
+        self.stages = []
+        self.files = []
+        self.extra = {}
+        self._open_stages = []  # Peak RSS seen so far by each enclosing stage
+
+    def _stage_memory(self):
+        # Stages nest: before resetting the high-water mark, fold it into the
+        # peaks of the stages still running
+        peak = high_water_rss_bytes()
+        for frame in self._open_stages:
+            frame["peak"] = max(frame["peak"], peak)
+        if not reset_high_water_rss():
+            return None
+        rss = current_rss_bytes()
+        frame = {"start": rss, "peak": rss}
+        self._open_stages.append(frame)
+        return frame
+
+    def _end_stage_memory(self, frame):
+        if frame is None:
+            # No per-stage figures on this platform: fall back to the process peak
+            return {"peak_rss_bytes": peak_rss_bytes()}
+        peak = max(frame["peak"], high_water_rss_bytes())
+        # Dicts compare by value: remove this very frame
+        self._open_stages = [
+            open_frame for open_frame in self._open_stages if open_frame is not frame
+        ]
+        for parent in self._open_stages:
+            parent["peak"] = max(parent["peak"], peak)
+        return {
+            "rss_start_bytes": frame["start"],
+            "rss_end_bytes": current_rss_bytes(),
+            "peak_rss_bytes": peak,
+            "peak_rss_delta_bytes": peak - frame["start"],
+        }
+
+    @contextmanager
+    def stage(self, name, file=None, **details):
+        memory = self._stage_memory() if self.stage_memory else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "wall_seconds": time.perf_counter() - wall_start,
+                "cpu_seconds": time.process_time() - cpu_start,
+            }
+            if self.stage_memory:
+                record.update(self._end_stage_memory(memory))
+            record.update(details)
+            if file is None:
+                self.stages.append(record)
+            else:
+                record["file"] = file
+                self.files.append(record)
+
+    def report(self):
+        totals = {}
+        for record in self.stages + self.files:
+            total = totals.setdefault(
+                record["stage"],
+                {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_delta_bytes": None},
+            )
+            total["count"] += 1
+            total["wall_seconds"] += record["wall_seconds"]
+            total["cpu_seconds"] += record["cpu_seconds"]
+            delta = record.get("peak_rss_delta_bytes")
+            if delta is not None:
+                total["peak_rss_delta_bytes"] = max(total["peak_rss_delta_bytes"] or 0, delta)
+
+        return dict(
+            self.extra,
+            stages=self.stages,
+            files=self.files,
+            totals=totals,
+            peak_rss_bytes=peak_rss_bytes(),
+        )
+
+    def emit(self, output_pdf):
+        if not self.sink:
+            return None
+
+        report = self.report()
+        if callable(self.sink):
+            self.sink(report)
+            return report
+
+        if isinstance(self.sink, (str, os.PathLike)):
+            metrics_path = self.sink
+        elif output_pdf is not None:
+            metrics_path = f"{output_pdf}.metrics.json"
+        else:
+            print("⚠️ Output is not a file: pass a metrics path or callable to keep the report")
+            return report
+        with open(metrics_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
@@ -0,0 +1,94 @@
+"""
+Sharing of identical fonts and images across merged inputs.
+
+PDFs produced by the same system each embed their own copy of the same fonts
+and logos. After merging, every font, font descriptor, embedded font file and
+image is hashed by content (see dedupe.ObjectHasher), and references to
+repeated copies are pointed at the first one. The copies are left
+unreferenced and dropped by the garbage collection pass of the save. Even a
+cheap garbage level then gives a small file, without garbage=4 comparing
+every object in the document.
+"""
+
+from dedupe import REFERENCE, ObjectHasher
+
+FONT_FILE_KEYS = ("FontFile", "FontFile2", "FontFile3")
+
+
+class ResourceInterner:
+    def __init__(self, doc):
+        self.doc = doc
+        self.resources = 0
+        self.duplicates = 0
+        self._hasher = ObjectHasher(doc)
+        self._canonical = {}  # (kind, content hash) -> xref of the first copy
+        self._remap = {}  # xref of a copy -> xref of the first copy
+
+    def _kind(self, xref):
+        doc = self.doc
+        type_name = doc.xref_get_key(xref, "Type")[1]
+        if type_name in ("/Font", "/FontDescriptor"):
+            return type_name
+        if doc.xref_get_key(xref, "Subtype")[1] == "/Image" and doc.xref_is_stream(xref):
+            return "/Image"
+        return None
+
+    def find_duplicates(self):
+        doc = self.doc
+        font_files = set()
+        resources = []
+        for xref in range(1, doc.xref_length()):
+            kind = self._kind(xref)
+            if kind is None:
+                continue
+            resources.append((kind, xref))
+            if kind == "/FontDescriptor":
+                for key in FONT_FILE_KEYS:
+                    value_kind, value = doc.xref_get_key(xref, key)
+                    if value_kind == "xref":
+                        font_files.add(int(value.split()[0]))
+        resources.extend(("/FontFile", xref) for xref in sorted(font_files))
+
+        for kind, xref in resources:
+            key = (kind, self._hasher.object_hash(xref))
+            first = self._canonical.setdefault(key, xref)
+            if first != xref:
+                self._remap[xref] = first
+        self.resources = len(resources)
+        self.duplicates = len(self._remap)
+
+    def _rewrite(self, text):
+        return REFERENCE.sub(
+            lambda m: f"{self._remap.get(int(m.group(1)), int(m.group(1)))} 0 R".encode(), text
+        )
+
+    def redirect_references(self):
+        doc = self.doc
+        for xref in range(1, doc.xref_length()):
+            if xref in self._remap:
+                continue  # About to become garbage
+            keys = doc.xref_get_keys(xref)
+            if keys:
+                # Key by key, so that stream data is never touched
+                for key in keys:
+                    value = doc.xref_get_key(xref, key)[1].encode()
+                    rewritten = self._rewrite(value)
+                    if rewritten != value:
+                        doc.xref_set_key(xref, key, rewritten.decode())
+            elif not doc.xref_is_stream(xref):
+                # Arrays such as indirect /DescendantFonts
+                source = doc.xref_object(xref, compressed=True).encode()
+                rewritten = self._rewrite(source)
+                if rewritten != source:
+                    doc.update_object(xref, rewritten.decode())
+
+    def stats(self):
+        return {"resources": self.resources, "duplicates": self.duplicates}
+
+
+def intern_resources(doc):
+    interner = ResourceInterner(doc)
+    interner.find_duplicates()
+    if interner.duplicates:
+        interner.redirect_references()
+    return interner.stats()
@@ -0,0 +1,371 @@
+"""
+Merge workers fed from a local job queue.
+
+A job is a JSON description of one dossier:
+
+    {"schema": {...}, "input_dir": "inputs/a", "output": "out/a.pdf",
+     "options": {"profile": "balanced"}}
+
+Workers lease jobs, run them with a Merger, and ack or nack them. A lease
+expires after a visibility timeout unless the worker keeps heartbeating, so
+jobs held by a dead worker go back to the queue. Failed jobs are retried up
+to max_attempts times. Two backends are included:
+
+- SQLiteQueue: one database file, for workers on a single machine
+- SpoolQueue: a directory tree driven by atomic renames, which also works
+  for workers on several nodes sharing a filesystem
+
+Usage:
+    python jobqueue.py submit --spool /shared/spool job.json
+    python jobqueue.py worker --spool /shared/spool
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from script import Merger
+
+# 🔹 Queue settings
+VISIBILITY_TIMEOUT = 300  # Seconds a lease lasts without a heartbeat
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # Seconds before a failed job can be leased again
+POLL_INTERVAL = 2
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and it was reclaimed, possibly by another worker."""
+
+
+class SQLiteQueue:
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self._connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    leased_by TEXT,
+                    lease_expires REAL,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, available_at);
+                CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    job_id INTEGER,
+                    last_seen REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        # One connection per call keeps the queue safe to use from the
+        # heartbeat thread and from several processes
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def put(self, job):
+        with self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO jobs (payload, available_at) VALUES (?, ?)",
+                (json.dumps(job), time.time()),
+            )
+            return cursor.lastrowid
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases whose worker already used every attempt
+                db.execute(
+                    "UPDATE jobs SET state = 'failed', error = 'Lease expired' "
+                    "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, self.max_attempts),
+                )
+                row = db.execute(
+                    "SELECT id, payload FROM jobs "
+                    "WHERE (state = 'pending' AND available_at <= ?) "
+                    "OR (state = 'leased' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET state = 'leased', leased_by = ?, lease_expires = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (worker_id, now + visibility_timeout, row[0]),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, worker_id, job_id=None, visibility_timeout=VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO workers (id, job_id, last_seen) VALUES (?, ?, ?)",
+                (worker_id, job_id, now),
+            )
+            if job_id is not None:
+                db.execute(
+                    "UPDATE jobs SET lease_expires = ? "
+                    "WHERE id = ? AND leased_by = ? AND state = 'leased'",
+                    (now + visibility_timeout, job_id, worker_id),
+                )
+
+    def ack(self, job_id, worker_id):
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET state = 'done', error = NULL "
+                "WHERE id = ? AND leased_by = ? AND state = 'leased'",
+                (job_id, worker_id),
+            )
+        if cursor.rowcount == 0:
+            raise LeaseLost(job_id)
+
+    def nack(self, job_id, worker_id, error, retry_delay=RETRY_DELAY):
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET error = ?, leased_by = NULL, available_at = ?, "
+                "state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END "
+                "WHERE id = ? AND leased_by = ? AND state = 'leased'",
+                (error, time.time() + retry_delay, self.max_attempts, job_id, worker_id),
+            )
+        if cursor.rowcount == 0:
+            raise LeaseLost(job_id)
+
+    def stats(self):
+        with self._connect() as db:
+            return dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+
+class SpoolQueue:
+    """Queue stored as JSON files moved between state directories.
+
+    os.rename is atomic on a single filesystem, so whichever worker renames a
+    pending file into leased/ owns it. A leased file's mtime is its last
+    heartbeat.
+    """
+
+    STATES = ("pending", "leased", "done", "failed", "workers")
+
+    def __init__(self, directory, max_attempts=MAX_ATTEMPTS):
+        self.directory = directory
+        self.max_attempts = max_attempts
+        for state in self.STATES:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, job_id):
+        return os.path.join(self.directory, state, f"{job_id}.json")
+
+    def _read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, path, record):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def put(self, job):
+        # Time-ordered ids keep leasing roughly first in, first out
+        job_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        record = {"job": job, "attempts": 0, "available_at": 0, "error": None}
+        self._write(self._path("pending", job_id), record)
+        return job_id
+
+    def _reclaim_expired(self):
+        now = time.time()
+        leased_dir = os.path.join(self.directory, "leased")
+        for entry in os.scandir(leased_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                record = self._read(entry.path)
+                expired = entry.stat().st_mtime + record["visibility_timeout"] < now
+            except (OSError, ValueError, KeyError):
+                continue
+            if not expired:
+                continue
+            job_id = entry.name[:-5]
+            target = "failed" if record["attempts"] >= self.max_attempts else "pending"
+            if target == "failed":
+                record["error"] = "Lease expired"
+                try:
+                    self._write(entry.path, record)
+                except OSError:
+                    continue
+            try:
+                os.rename(entry.path, self._path(target, job_id))
+            except OSError:
+                pass  # Another worker got there first
+
+    def lease(self, worker_id, visibility_timeout=VISIBILITY_TIMEOUT):
+        self._reclaim_expired()
+        now = time.time()
+        for name in sorted(os.listdir(os.path.join(self.directory, "pending"))):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-5]
+            pending_path = self._path("pending", job_id)
+            try:
+                if self._read(pending_path)["available_at"] > now:
+                    continue
+                leased_path = self._path("leased", job_id)
+                os.rename(pending_path, leased_path)
+            except (OSError, ValueError):
+                continue  # Leased by another worker in the meantime
+
+            record = self._read(leased_path)
+            record.update(
+                attempts=record["attempts"] + 1,
+                leased_by=worker_id,
+                visibility_timeout=visibility_timeout,
+            )
+            self._write(leased_path, record)
+            return job_id, record["job"]
+        return None
+
+    def heartbeat(self, worker_id, job_id=None, visibility_timeout=VISIBILITY_TIMEOUT):
+        self._write(
+            os.path.join(self.directory, "workers", f"{worker_id}.json"),
+            {"job_id": job_id, "last_seen": time.time()},
+        )
+        if job_id is not None:
+            try:
+                os.utime(self._path("leased", job_id))
+            except FileNotFoundError:
+                pass  # Lease lost: the job was reclaimed
+
+    def _claim(self, job_id, worker_id):
+        # Move the leased file out of reach of _reclaim_expired before
+        # checking the owner, so that the job cannot be reclaimed in between
+        leased_path = self._path("leased", job_id)
+        claimed_path = f"{leased_path}.{worker_id}.claimed"
+        try:
+            os.rename(leased_path, claimed_path)
+        except FileNotFoundError:
+            raise LeaseLost(job_id) from None
+        record = self._read(claimed_path)
+        if record.get("leased_by") != worker_id:
+            os.rename(claimed_path, leased_path)  # Another worker's lease now
+            raise LeaseLost(job_id)
+        return claimed_path, record
+
+    def ack(self, job_id, worker_id):
+        claimed_path, _ = self._claim(job_id, worker_id)
+        os.rename(claimed_path, self._path("done", job_id))
+
+    def nack(self, job_id, worker_id, error, retry_delay=RETRY_DELAY):
+        claimed_path, record = self._claim(job_id, worker_id)
+        record.update(error=error, available_at=time.time() + retry_delay)
+        self._write(claimed_path, record)
+        target = "failed" if record["attempts"] >= self.max_attempts else "pending"
+        os.rename(claimed_path, self._path(target, job_id))
+
+    def stats(self):
+        return {
+            state: sum(1 for name in os.listdir(os.path.join(self.directory, state))
+                       if name.endswith(".json"))
+            for state in ("pending", "leased", "done", "failed")
+        }
+
+
+def _heartbeat_loop(queue, worker_id, job_id, visibility_timeout, stop):
+    while not stop.wait(visibility_timeout / 3):
+        try:
+            queue.heartbeat(worker_id, job_id, visibility_timeout)
+        except Exception as exc:
+            print(f"⚠️ Heartbeat failed for job {job_id}: {exc}")
+
+
+def run_worker(queue, merger=None, worker_id=None, visibility_timeout=VISIBILITY_TIMEOUT,
+               poll_interval=POLL_INTERVAL, max_jobs=None, stop_event=None):
+    """Lease and run jobs until stop_event is set or max_jobs have run."""
+    merger = merger or Merger()
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    processed = 0
+    print(f"👷 Worker {worker_id} started")
+
+    while not stop_event.is_set() and (max_jobs is None or processed < max_jobs):
+        leased = queue.lease(worker_id, visibility_timeout)
+        if leased is None:
+            queue.heartbeat(worker_id)
+            stop_event.wait(poll_interval)
+            continue
+
+        job_id, job = leased
+        queue.heartbeat(worker_id, job_id, visibility_timeout)
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat_loop,
+            args=(queue, worker_id, job_id, visibility_timeout, stop_heartbeat),
+            daemon=True,
+        )
+        heartbeat.start()
+        try:
+            try:
+                merger.merge(job["schema"], job["output"], input_dir=job.get("input_dir"),
+                             **job.get("options", {}))
+            except Exception as exc:
+                print(f"❌ Job {job_id} failed: {type(exc).__name__}: {exc}")
+                queue.nack(job_id, worker_id, f"{type(exc).__name__}: {exc}")
+            else:
+                queue.ack(job_id, worker_id)
+        except LeaseLost:
+            # Its result is now another worker's to report
+            print(f"⚠️ Lost the lease on job {job_id}, leaving it to the queue")
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        processed += 1
+
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue-fed PDF merge workers")
+    parser.add_argument("command", choices=["worker", "submit", "stats"])
+    parser.add_argument("jobs", nargs="*", help="JSON job files to submit")
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--sqlite", help="path of the SQLite queue database")
+    backend.add_argument("--spool", help="spool directory shared by the workers")
+    parser.add_argument("--visibility-timeout", type=float, default=VISIBILITY_TIMEOUT)
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        queue = SQLiteQueue(args.sqlite, args.max_attempts)
+    else:
+        queue = SpoolQueue(args.spool, args.max_attempts)
+
+    if args.command == "submit":
+        for path in args.jobs:
+            with open(path, encoding="utf-8") as f:
+                print(f"📥 Queued {path} as job {queue.put(json.load(f))}")
+    elif args.command == "stats":
+        print(json.dumps(queue.stats(), indent=2))
+    else:
+        try:
+            run_worker(queue, visibility_timeout=args.visibility_timeout)
+        except KeyboardInterrupt:
+            print("👋 Worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Page selections for schema leaves.
+
+A leaf can name only some pages of its input:
+
+    {"file": "bank.pdf", "pages": "1-2,last"}
+
+Pages are numbered from 1. A selection is a comma-separated list of page
+numbers and ranges. "last" is the final page, and a range with an open end
+("5-") runs to the last page. A list of page numbers works too. Only the
+selected pages, and the resources they use, are copied into the output.
+"""
+
+
+def _page_number(text, page_count, default=None):
+    text = text.strip()
+    if not text:
+        if default is None:
+            raise ValueError("Empty page number")
+        return default
+    if text == "last":
+        return page_count
+    if not text.isdigit():
+        raise ValueError(f"Invalid page number {text!r}")
+    return int(text)
+
+
+def parse_page_selection(spec, page_count):
+    """0-based page indices of a selection, in the order given."""
+    if isinstance(spec, str):
+        items = spec.split(",")
+    elif isinstance(spec, int):
+        items = [spec]
+    else:
+        items = list(spec)
+
+    selection = []
+    for item in items:
+        if isinstance(item, int):
+            first = last = item
+        else:
+            start, dash, end = item.partition("-")
+            first = _page_number(start, page_count, default=1 if dash else None)
+            last = _page_number(end, page_count, default=page_count) if dash else first
+        for number in (first, last):
+            if not 1 <= number <= page_count:
+                raise ValueError(f"Page {number} out of range 1-{page_count}")
+        step = 1 if last >= first else -1
+        selection.extend(range(first - 1, last - 1 + step, step))
+
+    if not selection:
+        raise ValueError("Empty page selection")
+    return selection
+
+
+def page_runs(selection):
+    # Consecutive ascending pages become one (from_page, to_page) run
+    runs = []
+    for pno in selection:
+        if runs and pno == runs[-1][1] + 1:
+            runs[-1][1] = pno
+        else:
+            runs.append([pno, pno])
+    return runs
+
+
+def insert_pages(doc, source, selection=None, start_at=-1):
+    """Insert all of source, or only the selected page indices, into doc.
+
+    PyMuPDF forgets which source objects it copied after each insert_pdf
+    call unless final is false: keep that map for every run but the last, so
+    resources shared by several runs are only copied once.
+    """
+    if selection is None:
+        doc.insert_pdf(source, start_at=start_at, links=True, annots=True, show_progress=False)
+        return
+    runs = page_runs(selection)
+    for number, (from_page, to_page) in enumerate(runs, 1):
+        doc.insert_pdf(source, from_page=from_page, to_page=to_page, start_at=start_at,
+                       links=True, annots=True, show_progress=False, final=number == len(runs))
+        if start_at >= 0:
+            start_at += to_page - from_page + 1
@@ -2,7 +2,8 @@
 PDF Merger for Rental Application
 
 This script merges multiple PDF files into a single document with a table of contents.
-The document structure is defined in config.py (see config.example.py for template).
+The document structure is defined in config.py (see config.example.py for template),
+or passed directly to a Merger when used as a library.
 
 Features:
 - Automatic TOC generation with clickable links
@@ -12,8 +13,32 @@ Features:
 """
 
 import fitz  # PyMuPDF
+import io
+import mmap
 import os
-from config import SCHEMA  # Import SCHEMA from config file
+import pickle
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import groupby
+from dedupe import dedupe_pages
+from fragment_cache import FragmentCache
+from images import IMAGE_JPEG_QUALITY, optimize_images
+from incremental import (MAX_INCREMENTAL_SAVES, changed_leaves, leaf_records, load_manifest,
+                         manifest_path, splice, write_manifest)
+from instrumentation import Instrumentation
+from interning import intern_resources
+from page_ranges import insert_pages, parse_page_selection
+from preflight import PreflightError, check_inputs
+
+try:
+    import pikepdf  # Optional, used to linearize output
+except ImportError:
+    pikepdf = None
 
 # 🔹 SET YOUR DIRECTORIES HERE
 INPUT_DIR = "../../CleanFiles"
@@ -24,22 +49,249 @@ OUTPUT_PDF = os.path.join(OUTPUT_DIR, "dossier_locatif.pdf")
 TITLE_FONT_PATH = "./AirbnbCereal_W_Blk.otf"
 TEXT_FONT_PATH = "./AirbnbCereal_W_Bk.otf"  # or any other font you want to use for regular text
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# TOC page geometry (A4, same as fitz.Document.new_page defaults)
+TOC_PAGE_WIDTH, TOC_PAGE_HEIGHT = fitz.paper_size("a4")
+TOC_FIRST_ENTRY_Y = 100  # Below the "Table des Matières" title
+TOC_CONTINUED_ENTRY_Y = 60  # Top of the following TOC pages
+TOC_BOTTOM_MARGIN = 50
+TOC_LINE_SPACING = 25
+TOC_SECTION_GAP = 40  # Extra space before a new main section
 
+# Save optimization profiles, from quickest to smallest output
+SAVE_PROFILES = {
+    "fast": {"garbage": 0, "deflate": False, "clean": False, "use_objstms": False, "linear": False},
+    "balanced": {"garbage": 2, "deflate": True, "clean": False, "use_objstms": False, "linear": False},
+    "smallest": {"garbage": 4, "deflate": True, "clean": True, "use_objstms": True, "linear": False},
+    # Linearized ("fast web view"): page 1 renders before the rest has downloaded
+    "web": {"garbage": 3, "deflate": True, "clean": False, "use_objstms": False, "linear": True},
+}
+DEFAULT_SAVE_PROFILE = "smallest"
 
-def merge_pdfs():
-    doc = fitz.open()
+# Document cache limits (per process)
+CACHE_MAX_DOCUMENTS = 32
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+MMAP_INPUTS = False  # Map input files into memory instead of reading them
+
+
+class DocumentCache:
+    """LRU cache of opened source documents, keyed by path, mtime and size.
+
+    The cache owns the documents it returns: callers must not close them.
+    Pinned documents are never evicted, so a merge can hold on to all of its
+    inputs even when they add up to more than the limits. With mmap_inputs,
+    files are memory-mapped read-only so that processes merging the same
+    shared inputs use the same page-cache pages.
+    """
+
+    def __init__(self, max_documents=CACHE_MAX_DOCUMENTS, max_bytes=CACHE_MAX_BYTES,
+                 mmap_inputs=MMAP_INPUTS):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.mmap_inputs = mmap_inputs
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._docs = OrderedDict()  # key -> (document, size in bytes, mapping or None)
+        self._bytes = 0
+        self._pins = {}  # key -> number of holders
+
+    def open(self, path):
+        return self._open(path)[0]
+
+    def pin(self, path):
+        """Open path and keep it cached until unpin(key) is called.
+
+        Returns the document and the key to unpin it with.
+        """
+        doc, key = self._open(path)
+        self._pins[key] = self._pins.get(key, 0) + 1
+        return doc, key
+
+    def unpin(self, key):
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+        else:
+            self._pins.pop(key, None)
+        self._shrink()
+
+    def _open(self, path):
+        stat = os.stat(path)
+        real_path = os.path.realpath(path)
+        key = (real_path, stat.st_mtime_ns, stat.st_size)
+
+        entry = self._docs.get(key)
+        if entry is not None:
+            self._docs.move_to_end(key)
+            self.hits += 1
+            return entry[0], key
+
+        self.misses += 1
+        # The file changed on disk: drop the stale copy, unless a merge still uses it
+        for stale_key in [k for k in self._docs if k[0] == real_path and k not in self._pins]:
+            self._evict(stale_key)
+
+        doc, mapping = self._open_file(path, stat.st_size)
+        self._docs[key] = (doc, stat.st_size, mapping)
+        self._bytes += stat.st_size
+
+        # Never evict the document we are about to hand out
+        self._shrink(keep=key)
+        return doc, key
+
+    def _shrink(self, keep=None):
+        while len(self._docs) > self.max_documents or self._bytes > self.max_bytes:
+            key = next((k for k in self._docs if k != keep and k not in self._pins), None)
+            if key is None:
+                break  # Everything left is pinned or in use
+            self._evict(key)
+
+    def _open_file(self, path, size):
+        if not self.mmap_inputs or size == 0:
+            return fitz.open(path), None
+
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return fitz.open(stream=memoryview(mapping), filetype="pdf"), mapping
+        except (TypeError, ValueError):
+            mapping.close()
+
+        # This PyMuPDF only takes bytes streams: copying the mapping would
+        # defeat the purpose, so let MuPDF read the file on demand instead
+        doc = fitz.open(path)
+        self.mmap_inputs = False
+        print("⚠️ PyMuPDF cannot open memory-mapped buffers, reading files instead")
+        return doc, None
+
+    @staticmethod
+    def _close(doc, mapping):
+        doc.close()
+        if mapping is not None:
+            try:
+                mapping.close()
+            except BufferError:
+                pass  # Still referenced by PyMuPDF: released with the document
+
+    def _evict(self, key):
+        doc, size, mapping = self._docs.pop(key)
+        self._bytes -= size
+        self.evictions += 1
+        self._close(doc, mapping)
+
+    def clear(self):
+        for doc, _, mapping in self._docs.values():
+            self._close(doc, mapping)
+        self._docs.clear()
+        self._pins.clear()
+        self._bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "documents": len(self._docs),
+            "pinned": len(self._pins),
+            "bytes": self._bytes,
+        }
+
+
+class MergeCancelled(Exception):
+    pass
+
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise MergeCancelled("Merge cancelled")
+
+
+def leaf_file(leaf):
+    # A leaf with a page selection is {"file": ..., "pages": "1-2,last"}
+    return leaf["file"] if isinstance(leaf, dict) else leaf
+
+
+def is_in_memory(leaf):
+    # Schema leaves are file names, or PDF data as bytes, memoryview or a
+    # readable file-like object
+    leaf = leaf_file(leaf)
+    return isinstance(leaf, (bytes, bytearray, memoryview)) or hasattr(leaf, "read")
+
+
+def select_pages(leaf, name, page_count):
+    # Returns the selected page indices, or None for the whole document
+    if not isinstance(leaf, dict) or leaf.get("pages") is None:
+        return None
+    try:
+        return parse_page_selection(leaf["pages"], page_count)
+    except ValueError as exc:
+        raise ValueError(f"{name}: {exc}") from None
+
+
+def open_in_memory(leaf):
+    data = leaf.read() if hasattr(leaf, "read") else leaf
+    if isinstance(data, bytearray):
+        data = bytes(data)  # fitz.open(stream=...) takes bytes or a memoryview
+    return fitz.open(stream=data, filetype="pdf")
+
+
+def open_step(step, cache):
+    if step.get("document") is not None:
+        return step["document"]
+    return cache.open(step["path"])
+
+
+def close_plan(plan, cache=None):
+    # In-memory inputs are not owned by the cache: close them once merged.
+    # Files were pinned in the cache while planning: release them.
+    for step in plan["steps"]:
+        if step.get("document") is not None:
+            step["document"].close()
+            step["document"] = None
+        if cache is not None and step.get("pin") is not None:
+            cache.unpin(step.pop("pin"))
+
+
+def iter_leaves(schema):
+    # Every input referenced by a schema, in merge order
+    for content in schema.values():
+        if isinstance(content, list):
+            yield from content
+        elif isinstance(content, dict) and "_toc_" not in content:
+            yield from iter_leaves(content)
+
+
+# Shared by every merge in this process, so batch workers reuse documents
+# across dossiers as well as across sections
+DOCUMENT_CACHE = DocumentCache()
+
+
+def plan_layout(schema, input_dir=INPUT_DIR, cache=None, instrumentation=None):
+    """Compute the page layout of a dossier without merging anything.
+
+    Only page counts are read from the inputs. Returns a dict with the ordered
+    merge steps, both TOCs with their final page numbers, the index of the TOC
+    page and the total page count. Input files stay pinned in the cache until
+    close_plan(plan, cache) is called.
+    """
+    if cache is None:
+        cache = DOCUMENT_CACHE
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+
+    steps = []
     toc = []
     visible_toc = []
     current_page = 1  # Start from page 1
-    toc_page_number = None  # Will store where to insert TOC
-    
+    toc_page_number = None  # Will store where the TOC goes
+    top_section = None  # Top-level section currently being walked
+
     def process_section(title, content, level=1):
         nonlocal current_page, toc_page_number
 
         if isinstance(content, dict) and "_toc_" in content:
             toc_page_number = current_page - 1
+            steps.append({"kind": "toc", "section": top_section})
             current_page += 1
             return
 
@@ -48,14 +300,50 @@ def merge_pdfs():
                 toc.append([level, title, current_page])
                 visible_toc.append((title, current_page, level))
 
-            for pdf_file in content:
-                pdf_path = os.path.join(INPUT_DIR, pdf_file)
+            # Innermost schema node holding these inputs, e.g. "Person 2 / Work Contract"
+            group = " / ".join([parent["title"] for parent in parent_sections] + [title])
+            for leaf in content:
+                pdf_file = leaf_file(leaf)
+                if is_in_memory(pdf_file):
+                    name = f"<in-memory input {len(steps) + 1}>"
+                    with instrumentation.stage("open", file=name):
+                        document = open_in_memory(pdf_file)
+                    selection = select_pages(leaf, name, document.page_count)
+                    page_count = len(selection) if selection else document.page_count
+                    steps.append({
+                        "kind": "pdf",
+                        "path": None,
+                        "name": name,
+                        "document": document,
+                        "selection": selection,
+                        "pages": page_count,
+                        "section": top_section,
+                        "group": group,
+                    })
+                    current_page += page_count
+                    continue
+
+                pdf_path = os.path.join(input_dir, pdf_file)
                 if os.path.exists(pdf_path):
-                    sub_doc = fitz.open(pdf_path)
-                    page_count = len(sub_doc)
-                    doc.insert_pdf(sub_doc, links=True, annots=True, show_progress=False)
+                    # Opening only parses the xref; the document stays pinned
+                    # in the cache so the merge phase does not parse it again
+                    with instrumentation.stage("open", file=pdf_path):
+                        document, pin = cache.pin(pdf_path)
+                        page_count = document.page_count
+                    selection = select_pages(leaf, pdf_path, page_count)
+                    if selection:
+                        page_count = len(selection)
+                    steps.append({
+                        "kind": "pdf",
+                        "path": pdf_path,
+                        "name": pdf_path,
+                        "pin": pin,
+                        "selection": selection,
+                        "pages": page_count,
+                        "section": top_section,
+                        "group": group,
+                    })
                     current_page += page_count
-                    sub_doc.close()
                 else:
                     print(f"⚠️ File not found: {pdf_path}")
 
@@ -63,128 +351,918 @@ def merge_pdfs():
             if title != "Introduction":
                 toc.append([level, title, current_page])
                 visible_toc.append((title, current_page, level))
-            
+
             parent_sections.append({"title": title, "level": level})
             for sub_title, sub_content in content.items():
                 process_section(sub_title, sub_content, level=level + 1)
             parent_sections.pop()
 
     parent_sections = []
-    
-    # First pass: process all documents
-    for section, content in SCHEMA.items():
-        process_section(section, content, level=1)
+
+    try:
+        for top_section, content in schema.items():
+            process_section(top_section, content, level=1)
+    except BaseException:
+        close_plan({"steps": steps}, cache)
+        raise
 
     if toc_page_number is None:
         print("⚠️ No TOC placement found in schema, adding at the beginning")
         toc_page_number = 0
+        steps.insert(0, {"kind": "toc", "section": None})
+        current_page += 1
+        toc = [[level, title, page + 1] for level, title, page in toc]
+        visible_toc = [(title, page + 1, level) for title, page, level in visible_toc]
+
+    # The walk above reserved a single TOC page: shift everything after it
+    # by however many extra pages the TOC actually needs
+    toc_layout = paginate_toc(visible_toc)
+    extra_pages = len(toc_layout) - 1
+    if extra_pages:
+        toc = [
+            [level, title, page + extra_pages if page > toc_page_number + 1 else page]
+            for level, title, page in toc
+        ]
+        visible_toc = [
+            (title, page + extra_pages if page > toc_page_number + 1 else page, level)
+            for title, page, level in visible_toc
+        ]
+        current_page += extra_pages
+    for step in steps:
+        if step["kind"] == "toc":
+            step["pages"] = len(toc_layout)
+
+    return {
+        "steps": steps,
+        "toc": toc,
+        "visible_toc": visible_toc,
+        "toc_layout": toc_layout,
+        "toc_page": toc_page_number,
+        "page_count": current_page - 1,
+    }
+
+
+def paginate_toc(visible_toc):
+    """Split the visible TOC into pages.
+
+    Returns one list per TOC page of (entry index, y position) pairs. Only
+    titles and levels matter here, so this can run before page numbers are
+    final.
+    """
+    pages = [[]]
+    y_position = TOC_FIRST_ENTRY_Y
+    last_level = 1  # Track the level of the previous entry
+
+    for index, (_, _, level) in enumerate(visible_toc):
+        # Add extra spacing before new main section (except first one)
+        if level == 1 and last_level != 1 and pages[-1]:
+            y_position += TOC_SECTION_GAP
+
+        if y_position > TOC_PAGE_HEIGHT - TOC_BOTTOM_MARGIN:
+            pages.append([])
+            y_position = TOC_CONTINUED_ENTRY_Y
+
+        pages[-1].append((index, y_position))
+        y_position += TOC_LINE_SPACING
+        last_level = level
+
+    return pages
+
+
+# Fonts are parsed once per process and shared by every TOC rendered in it
+FONT_REGISTRY = {}
+
+
+def get_font(fontfile, label):
+    font = FONT_REGISTRY.get(fontfile)
+    if font is None:
+        try:
+            font = fitz.Font(fontfile=fontfile)
+        except:
+            print(f"⚠️ {label} font not loaded, falling back to helvetica")
+            font = fitz.Font("helv")
+        FONT_REGISTRY[fontfile] = font
+    return font
 
-    # Create and insert TOC at the specified position
-    toc_page = doc.new_page(toc_page_number)
-    
+
+def load_fonts(title_font_path=TITLE_FONT_PATH, text_font_path=TEXT_FONT_PATH):
     # Load custom fonts
-    try:
-        title_font = fitz.Font(fontfile=TITLE_FONT_PATH)
-    except:
-        print("⚠️ Title font not loaded, falling back to helvetica")
-        title_font = fitz.Font("helv")
+    return get_font(title_font_path, "Title"), get_font(text_font_path, "Text")
 
-    try:
-        text_font = fitz.Font(fontfile=TEXT_FONT_PATH)
-    except:
-        print("⚠️ Text font not loaded, falling back to helvetica")
-        text_font = fitz.Font("helv")
-    
-    # Add title with title font
+
+@lru_cache(maxsize=8192)
+def text_width(font, text, fontsize):
+    # Fonts live in FONT_REGISTRY for the whole process, so keying on the
+    # font object is safe; titles, page numbers and the leader dot repeat a lot
+    return font.text_length(text, fontsize=fontsize)
+
+
+def render_toc(doc, first_page, toc_layout, visible_toc, fonts, links=True):
+    # links=False draws the text only, for when the target pages do not exist
+    # yet: link_toc adds the links later
+    title_font, text_font = fonts
+    for page_offset, entries in enumerate(toc_layout):
+        render_toc_page(doc[first_page + page_offset], entries, visible_toc,
+                        title_font, text_font, with_title=page_offset == 0, links=links)
+
+
+def link_toc(doc, first_page, toc_layout, visible_toc):
+    for page_offset, entries in enumerate(toc_layout):
+        toc_page = doc[first_page + page_offset]
+        for index, y_position in entries:
+            _, page_number, level = visible_toc[index]
+            insert_toc_link(toc_page, y_position, page_number, level)
+
+
+def insert_toc_link(toc_page, y_position, page_number, level):
+    # Make the entire line clickable
+    text_x = 50 + 30 * (level - 1)
+    link_rect = fitz.Rect(text_x, y_position - 10, toc_page.rect.width - 50, y_position + 4)
+    toc_page.insert_link({
+        "kind": fitz.LINK_GOTO,
+        "from": link_rect,
+        "page": page_number - 1
+    })
+
+
+def render_toc_page(toc_page, entries, visible_toc, title_font, text_font, with_title,
+                    links=True):
+    # Everything on the page goes through one TextWriter, so the page gets a
+    # single content stream fragment however many entries it holds
     tw = fitz.TextWriter(toc_page.rect)
-    tw.append((50, 50), "Table des Matières", font=title_font, fontsize=24)
-    tw.write_text(toc_page)
+
+    # Add title with title font
+    if with_title:
+        tw.append((50, 50), "Table des Matières", font=title_font, fontsize=24)
 
     # Add visible TOC entries with text font
-    y_position = 100
     page_width = toc_page.rect.width
     margin_left = 50
     margin_right = 50
     content_width = page_width - margin_left - margin_right
-    last_level = 1  # Track the level of the previous entry
 
-    for title, page_number, level in visible_toc:
-        # Add extra spacing before new main section (except first one)
-        if level == 1 and last_level != 1:
-            y_position += 40  # Bigger gap before new main sections
-        
+    # Dot leaders use a smaller dot size, always with the text font
+    dot_char = "."
+    dot_width = text_width(text_font, dot_char, 9)
+
+    for index, y_position in entries:
+        title, page_number, level = visible_toc[index]
         indent = 30 * (level - 1)
         text_x = margin_left + indent
         text_y = y_position
 
         entry_text = f"{title}"
         page_text = f"{page_number}"
-        
+
         # Use title font for main sections (level 1) and text font for subsections
         current_font = title_font if level == 1 else text_font
         current_size = 14 if level == 1 else 11
-        
+
         # Calculate text widths for proper dot spacing
-        title_width = current_font.text_length(entry_text, fontsize=current_size)
-        page_num_width = text_font.text_length(page_text, fontsize=11)
-        
-        # Calculate available space for dots
+        title_width = text_width(current_font, entry_text, current_size)
+        page_num_width = text_width(text_font, page_text, 11)
+
+        # Fill the space between title and page number with dots
         dots_width = content_width - indent - title_width - page_num_width - 20
-        
-        # Calculate number of dots to fill the space (using a smaller dot size)
-        dot_char = "."
-        dot_width = text_font.text_length(dot_char, fontsize=9)
-        num_dots = int(dots_width / dot_width)
-        
-        tw = fitz.TextWriter(toc_page.rect)
-        
+        num_dots = max(int(dots_width / dot_width), 0)
+
         # Add the title (left-aligned)
         tw.append((text_x, text_y), entry_text, font=current_font, fontsize=current_size)
-        
-        # Add dots (always with text font)
+
+        # Add dots
         if level == 1:
             dot_y = text_y + 2  # Adjust dot position for better alignment with larger text
         else:
             dot_y = text_y
-        
-        tw.append((text_x + title_width + 10, dot_y), 
-                 dot_char * num_dots, 
-                 font=text_font, 
-                 fontsize=9)
-        
+
+        if num_dots:
+            tw.append((text_x + title_width + 10, dot_y),
+                      dot_char * num_dots,
+                      font=text_font,
+                      fontsize=9)
+
         # Add page number (right-aligned)
         page_x = page_width - margin_right - page_num_width
         tw.append((page_x, text_y), page_text, font=text_font, fontsize=11)
-        
-        tw.write_text(toc_page)
 
-        # Make the entire line clickable
-        link_rect = fitz.Rect(text_x, text_y - 10, page_width - margin_right, text_y + 4)
-        toc_page.insert_link({
-            "kind": fitz.LINK_GOTO,
-            "from": link_rect,
-            "page": page_number - 1
-        })
+        if links:
+            insert_toc_link(toc_page, text_y, page_number, level)
+
+    tw.write_text(toc_page)
+
+
+def append_steps(doc, steps, cache, instrumentation, cancel_event=None, fragments=None):
+    if fragments is None:
+        insert_steps(doc, steps, cache, instrumentation, cancel_event)
+        return
+
+    # With a fragment cache, each group of files listed under one schema node
+    # is merged once and then inserted as a whole on later runs, so a group
+    # reused elsewhere still hits when the rest of its section changed
+    for group, group_steps in groupby(steps, key=lambda step: step.get("group")):
+        group_steps = list(group_steps)
+        key = fragments.key(group_steps) if group is not None else None
+        if key is None:
+            insert_steps(doc, group_steps, cache, instrumentation, cancel_event)
+            continue
+
+        check_cancelled(cancel_event)
+        fragment = fragments.get(key)
+        if fragment is None:
+            fragment = fitz.open()
+            insert_steps(fragment, group_steps, cache, instrumentation, cancel_event)
+            with instrumentation.stage("store_fragment", file=group):
+                fragment = fragments.put(key, fragment)
+
+        with instrumentation.stage("insert_fragment", file=group, pages=fragment.page_count):
+            doc.insert_pdf(fragment, links=True, annots=True, show_progress=False)
+        fragment.close()
+
+
+def insert_steps(doc, steps, cache, instrumentation, cancel_event=None):
+    for step in steps:
+        check_cancelled(cancel_event)
+        if step["kind"] == "toc":
+            for _ in range(step["pages"]):
+                doc.new_page(width=TOC_PAGE_WIDTH, height=TOC_PAGE_HEIGHT)
+        else:
+            with instrumentation.stage("insert_pdf", file=step["name"], pages=step["pages"]):
+                insert_pages(doc, open_step(step, cache), step["selection"])
+
+
+def save_options(profile):
+    if isinstance(profile, dict):
+        return dict(profile)
+    try:
+        return dict(SAVE_PROFILES[profile])
+    except KeyError:
+        raise ValueError(
+            f"Unknown save profile {profile!r}, expected one of {', '.join(SAVE_PROFILES)}"
+        ) from None
+
+
+def save_document(doc, output_pdf, options):
+    # output_pdf is a file path or a writable binary stream
+    if not isinstance(output_pdf, (str, os.PathLike)) and not is_seekable(output_pdf):
+        # PyMuPDF seeks in the stream it saves to: build the file in memory,
+        # then write it out in order, e.g. to an HTTP response body
+        buffer = io.BytesIO()
+        save_document(doc, buffer, options)
+        buffer.seek(0)
+        shutil.copyfileobj(buffer, output_pdf)
+        return
+    options = dict(options)
+    # Object streams only exist in PyMuPDF >= 1.22 and exclude linearization
+    if not options.get("use_objstms") or options.get("linear"):
+        options.pop("use_objstms", None)
+    if options.get("linear"):
+        save_linearized(doc, output_pdf, options)
+    else:
+        doc.save(output_pdf, **options)
+
+
+def is_seekable(stream):
+    seekable = getattr(stream, "seekable", None)
+    return seekable is not None and seekable()
+
+
+def save_linearized(doc, output_pdf, options):
+    # MuPDF dropped linearization in 1.22: let qpdf do it through pikepdf when
+    # it is installed, and fall back to a regular save if nothing can
+    options = dict(options, linear=False)
+    if pikepdf is not None:
+        with pikepdf.open(io.BytesIO(doc.tobytes(**options))) as pdf:
+            pdf.save(output_pdf, linearize=True)
+        return
+    try:
+        doc.save(output_pdf, **dict(options, linear=True))
+    except Exception as exc:
+        print(f"⚠️ Cannot linearize with this PyMuPDF ({exc}), install pikepdf."
+              " Saving without linearization")
+        if not isinstance(output_pdf, (str, os.PathLike)):
+            output_pdf.seek(0)
+            output_pdf.truncate()
+        doc.save(output_pdf, **options)
+
+
+def add_stats(totals, name, stats):
+    # Streamed sections report their stats one at a time: add them up
+    if totals[name] is None:
+        totals[name] = dict(stats)
+    else:
+        for key, value in stats.items():
+            totals[name][key] += value
+
+
+def merge_in_chunks(plan, cache, output_path, chunk_dir, options, instrumentation, fonts,
+                    finish=None, cancel_event=None, fragments=None):
+    """Merge one top-level section at a time straight into output_path.
+
+    Each section is merged into a document of its own, post-processed with
+    finish(doc, toc_pages) and, for the section holding it, given its TOC
+    text. It is then compacted on its own and appended to the output with an
+    incremental save. Only one section, plus the output's xref table, is ever
+    held in memory. TOC links and the outline point into later sections, so
+    they are added last. Returns the time spent saving.
+    """
+    options = dict(options, linear=False)
+    toc_pages = len(plan["toc_layout"])
+    start = 0
+    save_seconds = 0.0
+    sections = groupby(plan["steps"], key=lambda step: step["section"])
+    for index, (section, steps) in enumerate(sections):
+        steps = list(steps)
+        chunk = fitz.open()
+        append_steps(chunk, steps, cache, instrumentation, cancel_event, fragments)
+        # This section's inputs are done with: let the cache evict them
+        close_plan({"steps": steps}, cache)
+
+        local_toc = range(0)
+        if start <= plan["toc_page"] < start + chunk.page_count:
+            first = plan["toc_page"] - start
+            local_toc = range(first, first + toc_pages)
+            with instrumentation.stage("render_toc", pages=toc_pages):
+                render_toc(chunk, first, plan["toc_layout"], plan["visible_toc"], fonts,
+                           links=False)
+        if finish is not None:
+            finish(chunk, local_toc)
+        start += chunk.page_count
+        check_cancelled(cancel_event)
+
+        save_start = time.perf_counter()
+        with instrumentation.stage("save_chunk", file=section, pages=chunk.page_count):
+            if index == 0:
+                save_document(chunk, output_path, options)
+                chunk.close()
+            else:
+                chunk_path = os.path.join(chunk_dir, "chunk.pdf")
+                save_document(chunk, chunk_path, options)
+                chunk.close()
+                doc = fitz.open(output_path)
+                chunk = fitz.open(chunk_path)
+                doc.insert_pdf(chunk, links=True, annots=True, show_progress=False)
+                chunk.close()
+                doc.saveIncr()
+                doc.close()
+        save_seconds += time.perf_counter() - save_start
+
+    save_start = time.perf_counter()
+    with instrumentation.stage("set_toc"):
+        doc = fitz.open(output_path)
+        link_toc(doc, plan["toc_page"], plan["toc_layout"], plan["visible_toc"])
+        doc.set_toc(plan["toc"])
+        doc.saveIncr()
+        doc.close()
+    return save_seconds + time.perf_counter() - save_start
+
+
+def join_chunks(chunk_paths):
+    doc = fitz.open()
+    for chunk_path in chunk_paths:
+        chunk = fitz.open(chunk_path)
+        doc.insert_pdf(chunk, links=True, annots=True, show_progress=False)
+        chunk.close()
+    return doc
+
+
+def partition_sections(steps, parts):
+    # Contiguous groups of whole top-level sections with similar page counts
+    sections = [list(group) for _, group in groupby(steps, key=lambda step: step["section"])]
+    target = sum(step["pages"] for step in steps) / max(parts, 1)
+    partitions = [[]]
+    pages = 0
+    for section in sections:
+        if partitions[-1] and len(partitions) < parts and pages >= target * len(partitions):
+            partitions.append([])
+        partitions[-1].extend(section)
+        pages += sum(step["pages"] for step in section)
+    return partitions
+
+
+def _merge_partition(steps, chunk_path, options, cache_settings, fragment_cache, cancel_event):
+    # Runs in a worker process, with a document cache set up like the parent's
+    start = time.perf_counter()
+    for step in steps:
+        if step.get("data") is not None:
+            step["document"] = fitz.open(stream=step.pop("data"), filetype="pdf")
+    cache = DocumentCache(*cache_settings)
+    fragments = FragmentCache(*fragment_cache) if fragment_cache is not None else None
+    chunk = fitz.open()
+    try:
+        append_steps(chunk, steps, cache, Instrumentation(), cancel_event, fragments)
+        save_document(chunk, chunk_path, dict(options, linear=False))
+    finally:
+        chunk.close()
+        close_plan({"steps": steps})
+        cache.clear()
+    return {
+        "seconds": time.perf_counter() - start,
+        "cache": cache.stats(),
+        "fragments": fragments.stats() if fragments is not None else None,
+    }
+
+
+def _shareable_event(cancel_event):
+    # Workers can only watch events that pickle, such as a
+    # multiprocessing.Manager().Event(): others are checked by the parent alone
+    if cancel_event is None:
+        return None
+    try:
+        pickle.dumps(cancel_event)
+    except Exception:
+        return None
+    return cancel_event
+
+
+def merge_in_parallel(plan, chunk_dir, options, instrumentation, workers, cache,
+                      cancel_event=None, fragments=None):
+    # Top-level sections are split into one partition per worker process. Each
+    # worker merges and compacts its partition into a chunk file, and the
+    # chunks are joined in order. Page numbers all come from the plan, and
+    # insert_pdf remaps the links inside each chunk, so pages, TOC and links
+    # match a serial merge. Objects shared across chunks are copied into each
+    # one: the final save merges them again if its garbage level is 3 or more.
+    partitions = partition_sections(plan["steps"], workers)
+    cache_settings = (cache.max_documents, cache.max_bytes, cache.mmap_inputs)
+    fragment_cache = (fragments.directory, fragments.max_bytes) if fragments is not None else None
+    worker_event = _shareable_event(cancel_event)
+    chunk_paths = [os.path.join(chunk_dir, f"part-{index:04d}.pdf") for index in range(len(partitions))]
+    results = [None] * len(partitions)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as pool:
+        futures = {}
+        for index, steps in enumerate(partitions):
+            # Open documents cannot be sent to another process: pass in-memory
+            # inputs as bytes instead
+            steps = [
+                dict(step, document=None, data=step["document"].tobytes())
+                if step.get("document") is not None else step
+                for step in steps
+            ]
+            future = pool.submit(_merge_partition, steps, chunk_paths[index], options,
+                                 cache_settings, fragment_cache, worker_event)
+            futures[future] = index
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                check_cancelled(cancel_event)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    if fragments is not None:
+        for result in results:
+            fragments.add_stats(result["fragments"])
+    instrumentation.extra["partitions"] = [
+        {"pages": sum(step["pages"] for step in steps), "seconds": result["seconds"],
+         "cache": result["cache"]}
+        for steps, result in zip(partitions, results)
+    ]
+    with instrumentation.stage("join", parts=len(chunk_paths)):
+        return join_chunks(chunk_paths)
+
 
-        # Add normal spacing after entries
-        y_position += 25  # Same spacing for all entries
-        last_level = level  # Remember current level for next iteration
+class Merger:
+    """Reusable merger holding settings and warm caches across many jobs.
+
+    Nothing is read or written at construction time: every merge gets its own
+    schema and output path, and defaults set here can be overridden per call.
+    """
+
+    def __init__(self, input_dir=INPUT_DIR, cache=None, profile=DEFAULT_SAVE_PROFILE,
+                 streaming=False, metrics=None, title_font_path=TITLE_FONT_PATH,
+                 text_font_path=TEXT_FONT_PATH, mmap_inputs=None, fragment_cache=None,
+                 incremental=False, preflight=False, dedupe=False, image_dpi=None,
+                 jpeg_quality=IMAGE_JPEG_QUALITY, parallel=False, share_resources=False):
+        # fragment_cache: a FragmentCache, or a directory to keep one in
+        # incremental: keep a manifest next to the output and only re-merge
+        # the inputs that changed since the previous run
+        # preflight: validate every input concurrently before merging anything
+        # dedupe: make repeated identical pages share one copy of their content
+        # share_resources: make identical fonts and images share one copy
+        # image_dpi: downsample images displayed above this resolution
+        # parallel: merge top-level sections in this many worker processes
+        # (True for one per CPU), then stitch the results
+        self.input_dir = input_dir
+        if cache is None:
+            if mmap_inputs is not None and mmap_inputs != DOCUMENT_CACHE.mmap_inputs:
+                cache = DocumentCache(mmap_inputs=mmap_inputs)
+            else:
+                cache = DOCUMENT_CACHE
+        self.cache = cache
+        if isinstance(fragment_cache, (str, os.PathLike)):
+            fragment_cache = FragmentCache(fragment_cache)
+        self.fragment_cache = fragment_cache
+        self.incremental = incremental
+        self.preflight_inputs = preflight
+        self.dedupe = dedupe
+        self.share_resources = share_resources
+        self.image_dpi = image_dpi
+        self.jpeg_quality = jpeg_quality
+        self.profile = profile
+        self.streaming = streaming
+        self.parallel = parallel
+        self.metrics = metrics
+        self.title_font_path = title_font_path
+        self.text_font_path = text_font_path
+
+    def preflight(self, schema, input_dir=None):
+        input_dir = input_dir or self.input_dir
+        paths = [
+            os.path.join(input_dir, leaf_file(leaf))
+            for leaf in iter_leaves(schema) if not is_in_memory(leaf)
+        ]
+        return check_inputs(paths)
+
+    def plan(self, schema, input_dir=None, instrumentation=None):
+        return plan_layout(schema, input_dir or self.input_dir, self.cache, instrumentation)
+
+    def merge(self, schema, output_pdf=None, input_dir=None, profile=None, streaming=None,
+              metrics=None, cancel_event=None, incremental=None, preflight=None, dedupe=None,
+              image_dpi=None, parallel=None, share_resources=None):
+        # output_pdf: a path, a writable binary stream, or None to get the PDF
+        # back as bytes in the returned stats ("data")
+        # metrics: True writes <output>.metrics.json, a path or callable picks the sink
+        # cancel_event: any object with is_set(), checked between inputs
+        check_cancelled(cancel_event)
+        cache = self.cache
+        profile = profile if profile is not None else self.profile
+        streaming = streaming if streaming is not None else self.streaming
+        parallel = parallel if parallel is not None else self.parallel
+        if parallel is True:
+            parallel = os.cpu_count()
+        options = save_options(profile)
+        profile_name = profile if isinstance(profile, str) else "custom"
+        instrumentation = Instrumentation(metrics if metrics is not None else self.metrics)
+        to_path = isinstance(output_pdf, (str, os.PathLike))
+        output_dir = os.path.dirname(output_pdf) if to_path else None
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        incremental = to_path and (incremental if incremental is not None else self.incremental)
+
+        settings = {
+            "share_resources": (share_resources if share_resources is not None
+                                else self.share_resources),
+            "dedupe": dedupe if dedupe is not None else self.dedupe,
+            "image_dpi": image_dpi if image_dpi is not None else self.image_dpi,
+        }
+        totals = {"resources": None, "dedupe": None, "images": None}
+        # Everything besides the inputs that shapes the output file
+        output_settings = dict(settings, save=options, jpeg_quality=self.jpeg_quality,
+                               fonts=[self.title_font_path, self.text_font_path])
+
+        merge_start = time.perf_counter()
+
+        if preflight if preflight is not None else self.preflight_inputs:
+            with instrumentation.stage("preflight"):
+                report = self.preflight(schema, input_dir)
+            if not report["ok"]:
+                raise PreflightError(report)
+
+        # First pass: page counts only, so every page number is known up front
+        with instrumentation.stage("plan"):
+            plan = self.plan(schema, input_dir, instrumentation)
+
+        buffer = io.BytesIO() if output_pdf is None else None
+        try:
+            if incremental:
+                manifest = load_manifest(output_pdf)
+                with instrumentation.stage("diff"):
+                    leaves = leaf_records(plan, manifest)
+                    changes = (changed_leaves(manifest, leaves, plan, output_settings)
+                               if manifest else None)
+                if changes and any(settings.values()):
+                    # Dedupe, shared resources and image downsampling work on
+                    # the whole document: spliced inputs would skip them
+                    print("🔄 Content optimizations are enabled, rebuilding in full")
+                    changes = None
+                if changes is not None:
+                    close_plan(plan, cache)
+                    return self._rebuild(plan, output_pdf, manifest, leaves, changes, options,
+                                         output_settings, instrumentation, merge_start)
+
+            with instrumentation.stage("load_fonts"):
+                fonts = load_fonts(self.title_font_path, self.text_font_path)
+
+            if streaming and not parallel:
+                save_seconds = self._merge_streaming(
+                    plan, buffer if buffer is not None else output_pdf, output_dir, options,
+                    instrumentation, fonts, settings, totals, cancel_event,
+                )
+                merge_seconds = time.perf_counter() - merge_start - save_seconds
+            else:
+                merge_seconds, save_seconds = self._merge_whole(
+                    plan, buffer if buffer is not None else output_pdf, output_dir, to_path,
+                    options, instrumentation, fonts, parallel, settings, totals, cancel_event,
+                )
+        finally:
+            close_plan(plan, cache)
+
+        if incremental:
+            if leaves is not None:
+                write_manifest(output_pdf, plan, leaves, settings=output_settings)
+            elif os.path.exists(manifest_path(output_pdf)):
+                # In-memory inputs cannot be tracked: drop the stale manifest
+                os.remove(manifest_path(output_pdf))
+
+        instrumentation.extra.update(
+            output=output_pdf,
+            pages=plan["page_count"],
+            profile=profile_name,
+            streaming=streaming,
+            parallel=parallel or None,
+            cache=cache.stats(),
+            fragments=self.fragment_cache.stats() if self.fragment_cache is not None else None,
+            **totals,
+        )
+        instrumentation.emit(output_pdf if to_path else None)
+
+        if to_path:
+            print(f"✅ Merged PDF created with selectable text and navigation: {output_pdf}")
+        print(f"⏱️ Merge {merge_seconds:.2f}s, save {save_seconds:.2f}s"
+              f" ({profile_name} profile)")
+        stats = {
+            "output": output_pdf if to_path else None,
+            "pages": plan["page_count"],
+            "merge_seconds": merge_seconds,
+            "save_seconds": save_seconds,
+        }
+        if buffer is not None:
+            stats["data"] = buffer.getvalue()
+        return stats
+
+    def _merge_whole(self, plan, output, output_dir, to_path, options, instrumentation, fonts,
+                     parallel, settings, totals, cancel_event):
+        # The whole dossier is assembled in memory, then saved in one go
+        merge_start = time.perf_counter()
+        # Second pass: write pages strictly in order, reserving the TOC page in place
+        with instrumentation.stage("merge"):
+            if parallel:
+                chunk_parent = (output_dir or ".") if to_path else None
+                with tempfile.TemporaryDirectory(prefix=".chunks-", dir=chunk_parent) as chunk_dir:
+                    doc = merge_in_parallel(plan, chunk_dir, options, instrumentation,
+                                            parallel, self.cache, cancel_event,
+                                            self.fragment_cache)
+            else:
+                doc = fitz.open()
+                append_steps(doc, plan["steps"], self.cache, instrumentation, cancel_event,
+                             self.fragment_cache)
+
+        try:
+            # The blank TOC pages are still identical: keep them out of dedupe
+            toc_pages = range(plan["toc_page"], plan["toc_page"] + len(plan["toc_layout"]))
+            self._optimize(doc, toc_pages, settings, totals, instrumentation, cancel_event)
+            self._report(settings, totals)
+
+            with instrumentation.stage("render_toc", pages=len(plan["toc_layout"])):
+                render_toc(doc, plan["toc_page"], plan["toc_layout"], plan["visible_toc"], fonts)
+
+            # Set the PDF navigation TOC
+            with instrumentation.stage("set_toc"):
+                doc.set_toc(plan["toc"])
+
+            merge_seconds = time.perf_counter() - merge_start
+            check_cancelled(cancel_event)
+
+            # Save the merged PDF with text preservation
+            save_start = time.perf_counter()
+            if parallel:
+                # Chunks are already compacted. Below garbage=3 only drop unused
+                # objects, at 3 and above still merge the copies of objects
+                # that several chunks share, as a serial merge would
+                garbage = options.get("garbage", 0)
+                options = dict(options, garbage=garbage if garbage >= 3 else min(garbage, 1),
+                               clean=False)
+            with instrumentation.stage("save"):
+                save_document(doc, output, options)
+        finally:
+            doc.close()
+        return merge_seconds, time.perf_counter() - save_start
+
+    def _merge_streaming(self, plan, output, output_dir, options, instrumentation, fonts,
+                         settings, totals, cancel_event):
+        # Sections are merged and written one at a time: see merge_in_chunks
+        if options.get("linear"):
+            print("⚠️ Streamed output is written incrementally and cannot be linearized")
+        to_path = isinstance(output, (str, os.PathLike))
+        chunk_parent = (output_dir or ".") if to_path else None
+        with tempfile.TemporaryDirectory(prefix=".chunks-", dir=chunk_parent) as chunk_dir:
+            target = os.path.join(chunk_dir, "output.pdf")
+            with instrumentation.stage("merge"):
+                save_seconds = merge_in_chunks(
+                    plan, self.cache, target, chunk_dir, options, instrumentation, fonts,
+                    lambda chunk, toc_pages: self._optimize(chunk, toc_pages, settings, totals,
+                                                            instrumentation, cancel_event),
+                    cancel_event, self.fragment_cache,
+                )
+            self._report(settings, totals)
+            # Nothing is written to the output until the whole dossier is done
+            if to_path:
+                os.replace(target, output)
+            else:
+                with open(target, "rb") as f:
+                    shutil.copyfileobj(f, output)
+        return save_seconds
+
+    def _optimize(self, doc, toc_pages, settings, totals, instrumentation, cancel_event=None):
+        # Optional content stages, run on the whole document or on each streamed section
+        if settings["share_resources"]:
+            with instrumentation.stage("intern_resources"):
+                add_stats(totals, "resources", intern_resources(doc))
+
+        if settings["dedupe"]:
+            with instrumentation.stage("dedupe"):
+                add_stats(totals, "dedupe", dedupe_pages(
+                    doc, (pno for pno in range(doc.page_count) if pno not in toc_pages)
+                ))
+
+        if settings["image_dpi"]:
+            check_cancelled(cancel_event)
+            with instrumentation.stage("optimize_images"):
+                add_stats(totals, "images",
+                          optimize_images(doc, settings["image_dpi"], self.jpeg_quality))
+
+    @staticmethod
+    def _report(settings, totals):
+        if totals["resources"] is not None:
+            print(f"🔗 {totals['resources']['duplicates']} duplicate font/image object(s) now shared")
+        if totals["dedupe"] is not None:
+            print(f"♻️ {totals['dedupe']['duplicates']} duplicate page(s) now share their content")
+        if totals["images"] is not None:
+            print(f"🖼️ {totals['images']['replaced']} image(s) downsampled to "
+                  f"{settings['image_dpi']} dpi, {totals['images']['bytes_saved'] / 1e6:.1f} MB saved")
+
+    def _rebuild(self, plan, output_pdf, manifest, leaves, changes, options, output_settings,
+                 instrumentation, merge_start):
+        toc_page = plan["toc_page"]
+        toc_pages = len(plan["toc_layout"])
+        if not changes and manifest["toc"] == plan["toc"]:
+            print(f"✅ Already up to date: {output_pdf}")
+            return {
+                "output": output_pdf,
+                "pages": plan["page_count"],
+                "merge_seconds": time.perf_counter() - merge_start,
+                "save_seconds": 0.0,
+                "changed": 0,
+            }
+
+        doc = fitz.open(output_pdf)
+        with instrumentation.stage("splice", changed=len(changes)):
+            splice(doc, changes, self.cache.open)
+
+        # Page numbers may have moved: redraw the TOC pages from scratch
+        with instrumentation.stage("render_toc", pages=toc_pages):
+            doc.delete_pages(toc_page, toc_page + toc_pages - 1)
+            for index in range(toc_pages):
+                doc.new_page(toc_page + index, width=TOC_PAGE_WIDTH, height=TOC_PAGE_HEIGHT)
+            fonts = load_fonts(self.title_font_path, self.text_font_path)
+            render_toc(doc, toc_page, plan["toc_layout"], plan["visible_toc"], fonts)
+
+        with instrumentation.stage("set_toc"):
+            doc.set_toc(plan["toc"])
+        merge_seconds = time.perf_counter() - merge_start
+
+        # Append only the changed objects to the file, compacting it with a
+        # full save every MAX_INCREMENTAL_SAVES runs. Appending would undo
+        # linearization, so linearized output is always saved in full.
+        save_start = time.perf_counter()
+        incremental_saves = manifest["incremental_saves"]
+        with instrumentation.stage("save"):
+            if (incremental_saves < MAX_INCREMENTAL_SAVES and not options.get("linear")
+                    and doc.can_save_incrementally()):
+                doc.saveIncr()
+                doc.close()
+                incremental_saves += 1
+            else:
+                tmp_path = f"{output_pdf}.tmp"
+                save_document(doc, tmp_path, options)
+                doc.close()
+                os.replace(tmp_path, output_pdf)
+                incremental_saves = 0
+        save_seconds = time.perf_counter() - save_start
+        write_manifest(output_pdf, plan, leaves, incremental_saves, output_settings)
+
+        instrumentation.extra.update(
+            output=output_pdf,
+            pages=plan["page_count"],
+            incremental=True,
+            changed=len(changes),
+            cache=self.cache.stats(),
+        )
+        instrumentation.emit(output_pdf)
+
+        print(f"✅ Updated {len(changes)} changed input(s) in {output_pdf}")
+        print(f"⏱️ Merge {merge_seconds:.2f}s, save {save_seconds:.2f}s")
+        return {
+            "output": output_pdf,
+            "pages": plan["page_count"],
+            "merge_seconds": merge_seconds,
+            "save_seconds": save_seconds,
+            "changed": len(changes),
+        }
+
+
+def merge_pdfs(schema=None, input_dir=INPUT_DIR, output_pdf=OUTPUT_PDF, cache=None,
+               streaming=False, profile=DEFAULT_SAVE_PROFILE, metrics=None, cancel_event=None,
+               fragment_cache=None, incremental=False, preflight=False, dedupe=False,
+               image_dpi=None, parallel=False, share_resources=False):
+    if schema is None:
+        from config import SCHEMA  # Import SCHEMA from config file
+        schema = SCHEMA
+
+    merger = Merger(input_dir, cache=cache, profile=profile, streaming=streaming, metrics=metrics,
+                    fragment_cache=fragment_cache, incremental=incremental, preflight=preflight,
+                    dedupe=dedupe, image_dpi=image_dpi, parallel=parallel,
+                    share_resources=share_resources)
+    return merger.merge(schema, output_pdf, cancel_event=cancel_event)
+
+
+def _run_job(job, options):
+    # Runs inside a worker process: never let an exception escape so that one
+    # broken dossier cannot take the whole batch down with it.
+    schema, input_dir, output_pdf = job
+    start = time.perf_counter()
+    try:
+        stats = merge_pdfs(schema, input_dir, output_pdf, **options)
+    except Exception as exc:
+        return {
+            "output": output_pdf,
+            "ok": False,
+            "error": f"{type(exc).__name__}: {exc}",
+            "seconds": time.perf_counter() - start,
+        }
+    return dict(stats, ok=True, error=None, seconds=time.perf_counter() - start)
+
+
+def _run_isolated(job, options):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(_run_job, job, options).result()
+        except BrokenProcessPool as exc:
+            # The worker process itself died
+            return {
+                "output": job[2],
+                "ok": False,
+                "error": f"Worker process crashed: {exc}",
+                "seconds": None,
+            }
+
+
+def merge_batch(jobs, workers=None, **options):
+    """Merge many dossiers in parallel.
+
+    `jobs` is a list of (schema, input_dir, output_pdf) tuples; extra keyword
+    arguments are passed on to merge_pdfs. Results are returned in the same
+    order as the jobs, one dict per job.
+    """
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    start = time.perf_counter()
+
+    def record(index, result):
+        results[index] = result
+        if result["ok"]:
+            print(f"✅ [{index + 1}/{len(jobs)}] {result['output']} ({result['seconds']:.2f}s)")
+        else:
+            print(f"❌ [{index + 1}/{len(jobs)}] {result['output']}: {result['error']}")
 
-    # Set the PDF navigation TOC
-    doc.set_toc(toc)
+    # A worker crash (e.g. a segfault inside MuPDF) breaks the whole pool and
+    # fails every unfinished future with it, not just the job that crashed
+    crashed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_job, job, options): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                record(index, future.result())
+            except BrokenProcessPool:
+                crashed.append(index)
+            except Exception as exc:
+                # e.g. a job that cannot be sent to the worker process
+                record(index, {
+                    "output": jobs[index][2],
+                    "ok": False,
+                    "error": f"{type(exc).__name__}: {exc}",
+                    "seconds": None,
+                })
 
-    # Save the merged PDF with text preservation
-    doc.save(
-        OUTPUT_PDF,
-        garbage=4,  # Optimize PDF
-        deflate=True,  # Compress streams
-        clean=True  # Remove unused elements
-    )
-    doc.close()
+    if crashed:
+        # There is no telling which of them crashed: run each one again in a
+        # process of its own, so that only the culprit fails
+        print(f"⚠️ A worker process died, retrying {len(crashed)} unfinished job(s) one per process")
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as threads:
+            for index, result in zip(sorted(crashed), threads.map(
+                lambda index: _run_isolated(jobs[index], options), sorted(crashed)
+            )):
+                record(index, result)
 
-    print(f"✅ Merged PDF created with selectable text and navigation: {OUTPUT_PDF}")
+    failed = sum(1 for result in results if not result["ok"])
+    elapsed = time.perf_counter() - start
+    print(f"📦 Batch done: {len(jobs) - failed} merged, {failed} failed in {elapsed:.2f}s")
+    return results
 
 
 # Run the merging function
 if __name__ == "__main__":
-    merge_pdfs()
\ No newline at end of file
+    merge_pdfs()
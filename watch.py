@@ -0,0 +1,177 @@
+"""
+Watch mode: rebuild dossiers as their input files land or change.
+
+Filesystem events come from watchdog (inotify on Linux) when it is installed,
+otherwise the referenced files are polled. Events are debounced. Each changed
+file is mapped back to the dossiers whose schema references it, and only those
+are rebuilt, incrementally. Files that were only read, as every rebuild reads
+its inputs, do not count as changed.
+
+Usage:
+    python watch.py            # watches the dossier defined in config.py
+    python watch.py --poll     # force the polling fallback
+"""
+
+import argparse
+import os
+import queue
+import time
+
+from script import INPUT_DIR, OUTPUT_PDF, Merger, is_in_memory, iter_leaves, leaf_file
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# 🔹 Watch settings
+DEBOUNCE_SECONDS = 2.0  # Quiet time after the last change before rebuilding
+POLL_INTERVAL = 5.0  # Seconds between scans when polling
+# Event types that can mean new content: reading an input, as every rebuild
+# does, fires "opened" and "closed_no_write" events on Linux
+CHANGE_EVENTS = ("created", "modified", "moved", "deleted", "closed")
+
+
+def index_jobs(jobs):
+    # Real path of every referenced input -> indices of the jobs using it
+    index = {}
+    for number, (schema, input_dir, _) in enumerate(jobs):
+        for leaf in iter_leaves(schema):
+            if not is_in_memory(leaf):
+                path = os.path.realpath(os.path.join(input_dir, leaf_file(leaf)))
+                index.setdefault(path, set()).add(number)
+    return index
+
+
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PollingWatcher:
+    def __init__(self, paths, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.states = {path: file_state(path) for path in paths}
+
+    def wait(self, timeout):
+        # Returns the paths that changed since the last call
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for path, state in self.states.items():
+            current = file_state(path)
+            if current != state:
+                self.states[path] = current
+                changed.add(path)
+        return changed
+
+    def stop(self):
+        pass
+
+
+class EventWatcher:
+    def __init__(self, paths):
+        self.paths = set(paths)
+        self.states = {path: file_state(path) for path in self.paths}
+        self.events = queue.Queue()
+        events = self.events
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type not in CHANGE_EVENTS:
+                    return
+                events.put(event.src_path)
+                if getattr(event, "dest_path", None):
+                    events.put(event.dest_path)
+
+        # Watch the directories holding referenced files, not the whole tree
+        self.observer = Observer()
+        handler = Handler()
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            if os.path.isdir(directory):
+                self.observer.schedule(handler, directory, recursive=False)
+            else:
+                print(f"⚠️ Not watching missing directory: {directory}")
+        self.observer.start()
+
+    def wait(self, timeout):
+        changed = set()
+        try:
+            path = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return changed
+        while True:
+            path = os.path.realpath(path)
+            if path in self.paths:
+                # Only report files whose content may differ
+                current = file_state(path)
+                if current != self.states[path]:
+                    self.states[path] = current
+                    changed.add(path)
+            try:
+                path = self.events.get_nowait()
+            except queue.Empty:
+                return changed
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+def watch(jobs, merger=None, debounce=DEBOUNCE_SECONDS, poll=False, poll_interval=POLL_INTERVAL):
+    """Rebuild the affected (schema, input_dir, output_pdf) jobs until interrupted."""
+    jobs = list(jobs)
+    merger = merger or Merger(incremental=True)
+    index = index_jobs(jobs)
+
+    if poll or Observer is None:
+        watcher = PollingWatcher(index, poll_interval)
+        print(f"👀 Polling {len(index)} input files every {poll_interval:g}s")
+    else:
+        watcher = EventWatcher(index)
+        print(f"👀 Watching {len(index)} input files")
+
+    pending = set()
+    last_change = None
+    try:
+        while True:
+            changed = watcher.wait(debounce if pending else poll_interval)
+            if changed:
+                pending |= changed
+                last_change = time.monotonic()
+                continue
+            if not pending or time.monotonic() - last_change < debounce:
+                continue
+
+            affected = sorted({number for path in pending for number in index[path]})
+            print(f"🔄 {len(pending)} changed file(s), rebuilding {len(affected)} dossier(s)")
+            pending.clear()
+            for number in affected:
+                schema, input_dir, output_pdf = jobs[number]
+                try:
+                    merger.merge(schema, output_pdf, input_dir=input_dir, incremental=True)
+                except Exception as exc:
+                    print(f"❌ {output_pdf}: {type(exc).__name__}: {exc}")
+    except KeyboardInterrupt:
+        print("👋 Stopped watching")
+    finally:
+        watcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild dossiers when their inputs change")
+    parser.add_argument("--poll", action="store_true", help="poll files instead of using watchdog")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="polling interval")
+    args = parser.parse_args()
+
+    from config import SCHEMA  # Import SCHEMA from config file
+    watch([(SCHEMA, INPUT_DIR, OUTPUT_PDF)], debounce=args.debounce, poll=args.poll,
+          poll_interval=args.interval)
+
+
+if __name__ == "__main__":
+    main()